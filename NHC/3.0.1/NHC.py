@@ -5,602 +5,2685 @@ __copyright__ = "Laboratory of Human Genetics of Infectious Diseases, The Rocefe
 __license__ = "CC BY-NC-ND 4.0"
 __version__ = "verion-3, 2024-02"
 
+# NHC runs as a script (see main) and can be imported as a library, the
+# pipeline being split into stages that work on plain dicts and lists:
+#
+#   references = load_references(data)
+#   cohort = load_cohort(path + filename_input, filename_pc)
+#   case_network_dict = filter_network(references, cohort, edge_cutoff, hub_cutoff)
+#   cluster_result_list = cluster_genes(cohort, case_network_dict, boost, threads, topk=topk, stop_edge=stop_edge)
+#   merged_line_list = merge_clusters(cluster_result_list, merge_cutoff)
+#   cluster_output_list, enriched_count = enrich_clusters(references, cohort, merged_line_list, mode, glm, threads,
+#                                                         permutations)
+#   export_variants(cohort, cluster_output_list, output_dir, export)
+#   export_network(case_network_dict, cohort, cluster_output_list, output_dir, export)
+#
+# run_nhc chains the stages for one set of cutoffs into an output folder, with
+# checkpoints to resume from, and run_sweep evaluates a grid of cutoffs on
+# references loaded once. With -serve, NHC.py stays up as a daemon holding the
+# references of one data folder and runs the jobs that nhc-client sends it.
 
 import os
+import sys
 import time
+import heapq
+import json
+import gzip
+import hashlib
+import resource
+import signal
+import socket
 import argparse
-from scipy import stats
-import rpy2
-import rpy2.robjects as ro
+import array
+import traceback
+import multiprocessing
+import numpy as np
 from decimal import Decimal
 from collections import defaultdict
-from datetime import datetime
+import nhc_reference
+# SciPy is imported by the enrichment stage and rpy2 only for -glm R, so that
+# runs that never reach them do not pay for loading them or starting R
+
+database_list = ['MSigDB_Hallmark','KEGG_Pathway','Reactome_Pathway','Wiki_Pathway',
+				'GO_BiologicalProcess','GO_MolecularFunction']
+cluster_output_header = ('Cluster\tGene_Count\tGene_Cluster\tCase_Count\tCase_Cluster\tCluster_pvalue\t'
+						 'MSigDB_Hallmark\tKEGG_Pathway\tReactome_Pathway\tWiki_Pathway\t'
+						 'GO_BiologicalProcess\tGO_MolecularFunction\n')
+# columns added to the cluster table with -permutations: p-values of the
+# standardized count of carrier cases under permuted case/control labels, not
+# adjusted for the PCs, unlike the glm p-value of Cluster_pvalue
+cluster_permutation_header = 'Empirical_pvalue\tFWER_pvalue'
+
+# hot-path counters of the stage in progress and the iterations of every seed
+# expansion, read into the profile when the stage ends (see profile_end)
+profile_counter_dict = defaultdict(int)
+profile_expansion_list = list()
+# stage records of the run, None unless profiling was started
+profile_stage_list = None
+# enrichment cache of the run, None unless started with -cache (see
+# cache_start), and the version of its files, part of every cache key
+enrichment_cache = None
+enrichment_cache_version = '1'
+# buffer of each export file, so that thousands of small cluster files and the
+# consolidated tables are written in large blocks
+export_buffer_size = 1048576
+# merged clusters per block of the enrichment worker pool: at least
+# enrichment_block_min, and enrichment_block_per_worker blocks per worker
+enrichment_block_min = 16
+enrichment_block_per_worker = 8
+# seed of the label permutations and the size of the largest array of a
+# chunk of permutations, in bytes
+permutation_seed = 1
+permutation_memory = 33554432
+# seed of the sample of seeds compared by the report of the approximate mode
+approximation_report_seed = 1
+
 
 ###
 # (1) Input Parameters
 ###
 
-print('\n---------------------------------------')
-print('   ###    ##   ##     ##     ######    ')
-print('   ## #   ##   ##     ##    ##    ##   ')
-print('   ##  #  ##   #########   ##          ')
-print('   ##   # ##   ##     ##    ##    ##   ')
-print('   ##    ###   ##     ##     ######    \n')
-print(' Network-based Heterogenity Clustering ')
-print('---------------------------------------\n')
-
-global_start = time.time()
-parser = argparse.ArgumentParser(description="Network-based Heterogenity Clustering")
-parser.add_argument("-path", help="absolute path of the input files")
-parser.add_argument("-input", help="input file for samples, genes and variants [check test_input.txt]")
-parser.add_argument("-pc", help="three principal components for all samples [check test_pc.txt]")
-parser.add_argument("-mode", type=int, default=1, help="(default=1), 1 for case-only analysis; 2 for case-vs-control analysis")
-parser.add_argument("-edge", type=float, default=0.99, help="(default=0.99), edge weight cutoff, range: 0.7~1")
-parser.add_argument("-hub", type=int, default=100, help="(default=100), remove hub genes with high connectivity, use 0 to keep all genes")
-parser.add_argument("-merge", type=float, default=0.5, help="(default=0.5), merge overlapped gene clusters, range: 0~1")
-parser.add_argument("-boost", type=str, default='N', help="(default=N), Y or N to use boost version")
-parser.add_argument("-network", type=str, default='N', help="(default=N), Y or N to generate network files for visualization")
-parser.add_argument("-suffix", help="suffix of output folder")
-parser.add_argument("-data", help="Absolute path to data folder contain reference files for NHC.")
-
-args = parser.parse_args()
-path = args.path
-filename_input = args.input
-filename_pc = args.pc
-mode = args.mode
-edge_cutoff = args.edge
-hub_cutoff = args.hub
-merge_cutoff = args.merge
-boost = args.boost
-network = args.network
-suffix = args.suffix
-# This is the directory to the data folder
-# containing the reference files for NHC
-# such as the Data_NHC_Network_Connectivity.txt
-# Data_NHC_Network.txt, Data_NHC_Geneset.txt
-# etc.
-data = os.path.abspath(args.data)
-
-year = str(datetime.now().year)
-month = str(datetime.now().month)
-day = str(datetime.now().day)
-hour = str(datetime.now().hour)
-minute = str(datetime.now().minute)
-second = str(datetime.now().second)
-timestamp = year+'-'+month+'-'+day+'-'+hour+'-'+minute+'-'+second
-
-if path[-1] != '/':
-	path = path + '/'
-output_folder = 'NHC_output'+'_'+suffix
-os.system('mkdir -p '+path+output_folder)
-
-file_parameter = open(path+output_folder+'/NHC_input_parameters.txt', 'w')
-file_parameter.write('---------------------------------------\n')
-file_parameter.write('   ###    ##   ##     ##     ######    \n')
-file_parameter.write('   ## #   ##   ##     ##    ##    ##   \n')
-file_parameter.write('   ##  #  ##   #########   ##          \n')
-file_parameter.write('   ##   # ##   ##     ##    ##    ##   \n')
-file_parameter.write('   ##    ###   ##     ##     ######    \n')
-file_parameter.write(' Network-based Heterogenity Clustering \n')
-file_parameter.write('---------------------------------------\n\n')
-file_parameter.write('NHC Parameters\n\n')
-file_parameter.write('Path: ' + path + '\n')
-file_parameter.write('Input: ' + filename_input + '\n')
-file_parameter.write('PC: ' + filename_pc + '\n')
-file_parameter.write('Mode: ' + str(mode) + '\n')
-file_parameter.write('Edge-Weight Cutoff: ' + str(edge_cutoff) + '\n')
-file_parameter.write('Hub-Gene Cutoff: ' + str(hub_cutoff) + '\n')
-file_parameter.write('Cluster-Merge Cutoff: ' + str(merge_cutoff) + '\n')
-file_parameter.write('Boost: ' + boost + '\n')
-file_parameter.write('Network: ' + network + '\n')
-file_parameter.write('Suffix: ' + suffix + '\n')
-file_parameter.write('Output: ' + path + output_folder + '\n')
+# function for the NHC_input_parameters.txt of an output folder, from a list
+# of (label, value) pairs
+def write_parameters(output_dir, parameter_list):
+	file_parameter = open(output_dir+'/NHC_input_parameters.txt', 'w')
+	file_parameter.write('---------------------------------------\n')
+	file_parameter.write('   ###    ##   ##     ##     ######    \n')
+	file_parameter.write('   ## #   ##   ##     ##    ##    ##   \n')
+	file_parameter.write('   ##  #  ##   #########   ##          \n')
+	file_parameter.write('   ##   # ##   ##     ##    ##    ##   \n')
+	file_parameter.write('   ##    ###   ##     ##     ######    \n')
+	file_parameter.write(' Network-based Heterogenity Clustering \n')
+	file_parameter.write('---------------------------------------\n\n')
+	file_parameter.write('NHC Parameters\n\n')
+	for label, value in parameter_list:
+		file_parameter.write(label + ': ' + str(value) + '\n')
+	file_parameter.close()
+
+
+# function for the cutoffs of a -sweep grid such as edge=0.95,0.99:merge=0.3,0.5,
+# cutoffs left out of the grid keep their single value
+def sweep_grid(sweep, edge_cutoff, hub_cutoff, merge_cutoff):
+	grid_dict = {'edge': [edge_cutoff], 'hub': [hub_cutoff], 'merge': [merge_cutoff]}
+	if sweep is None:
+		return grid_dict['edge'], grid_dict['hub'], grid_dict['merge']
+	for each_grid in sweep.split(':'):
+		item = each_grid.split('=')
+		if len(item) != 2 or item[0] not in grid_dict:
+			raise ValueError('-sweep expects edge=..., hub=... or merge=... separated by ":", got ' + each_grid)
+		if item[0] == 'hub':
+			grid_dict[item[0]] = [int(value) for value in item[1].split(',')]
+		else:
+			grid_dict[item[0]] = [float(value) for value in item[1].split(',')]
+	return grid_dict['edge'], grid_dict['hub'], grid_dict['merge']
 
 
 ###
 # (2) Loading Data
 ###
-print('>> Loading Data\n')
-
-file_input = open(path + filename_input, 'r')
-input_header = file_input.readline()
-case_set = set()
-case_gene_set = set()
-case_gene_set_dict = defaultdict(set)
-case_gene_var_set_dict = defaultdict(lambda: defaultdict(set))
-ctl_set = set()
-ctl_gene_set_dict = defaultdict(set)
-for eachline in file_input:
-	item = eachline.strip().split('\t')
-	group = item[0]
-	sample = item[1]
-	gene = item[2]
-	var = '\t'.join(item[3:])
-	if group == 'case':
-		case_set.add(sample)
-		case_gene_set.add(gene)
-		case_gene_set_dict[sample].add(gene)
-		case_gene_var_set_dict[sample][gene].add(var)
-	elif group == 'control':
-		ctl_set.add(sample)
-		ctl_gene_set_dict[sample].add(gene)
-case_list = list(case_set)
-case_list.sort()
-ctl_list = list(ctl_set)
-ctl_list.sort()
-file_input.close()
-
-
-file_pc = open(filename_pc, 'r')
-file_pc.readline()
-pc_dict = dict()
-for eachline in file_pc:
-	item = eachline.strip().split('\t')
-	sample = item[0]
-	pc1 = item[1]
-	pc2 = item[2]
-	pc3 = item[3]
-	pc_dict[sample] = pc1 + '\t' + pc2 + '\t' + pc3
-file_pc.close()
-
-
-file_connectivity = open(os.path.join(data, 'Data_NHC_Network_Connectivity.txt'), 'r')
-hub_gene_set = set()
-for eachline in file_connectivity:
-	item = eachline.strip().split('\t')
-	gene = item[0]
-	connectivity = int(item[1])
-	if connectivity >= hub_cutoff:
-		hub_gene_set.add(gene)
-file_connectivity.close()
-
-
-file_network = open(os.path.join(data, 'Data_NHC_Network.txt'), 'r')
-case_network_dict = dict()
-for eachline in file_network:
-	item = eachline.strip().split('\t')
-	geneA = item[0]
-	geneB = item[1]
-	gene_pair = (geneA, geneB)
-	edge = float(item[2])
-	if (geneA in case_gene_set) and (geneB in case_gene_set) and (edge >= edge_cutoff):
-		if hub_cutoff == 0:
-			case_network_dict[gene_pair] = edge
-		else:
-			if (geneA not in hub_gene_set) and (geneB not in hub_gene_set):
-				case_network_dict[gene_pair] = edge
-file_network.close()
 
-
-file_enrichment = open(os.path.join(data, 'Data_NHC_Geneset.txt'), 'r')
-database_list = ['MSigDB_Hallmark','KEGG_Pathway','Reactome_Pathway','Wiki_Pathway',
-				'GO_BiologicalProcess','GO_MolecularFunction']
-database_gene_set_dict = defaultdict(set)
-database_term_gene_set_dict = defaultdict(lambda: defaultdict(set))
-for eachline in file_enrichment:
-	item = eachline.strip().split('\t')
-	database = item[0]
-	term = item[1]
-	gene_set = set(item[3].split(','))
-	database_gene_set_dict[database] = database_gene_set_dict[database] | gene_set
-	database_term_gene_set_dict[database][term] = gene_set
-file_enrichment.close()
+# function for the fingerprints of the network and gene-set references of the
+# data folder, which change with the files
+def reference_fingerprints(data):
+	geneset_stat = os.stat(os.path.join(data, 'Data_NHC_Geneset.txt'))
+	network_fingerprint = '\n'.join(nhc_reference.reference_fingerprint(data))
+	geneset_fingerprint = str(geneset_stat.st_size) + '\t' + str(geneset_stat.st_mtime_ns)
+	return network_fingerprint, geneset_fingerprint
+
+
+# function for loading the reference files of the data folder: the network
+# compiled by nhc-compile-reference when it is present, otherwise the same
+# arrays parsed from the text files with parse Y, for callers that filter the
+# network several times, or with parse N the text files, filtered line by line
+# by the only filter_network of the run; and the gene sets. The sparse gene-set
+# matrices are added by the enrichment stage the first time it runs
+def load_references(data, parse='Y'):
+	references = dict()
+	network_reference = nhc_reference.load_reference(data)
+	if network_reference is None and parse == 'Y':
+		network_reference = nhc_reference.parse_reference(data)
+	elif network_reference is None:
+		network_reference = nhc_reference.text_reference(data)
+	references['network'] = network_reference
+	references['network_fingerprint'], references['geneset_fingerprint'] = reference_fingerprints(data)
+
+	file_enrichment = open(os.path.join(data, 'Data_NHC_Geneset.txt'), 'r')
+	database_gene_set_dict = defaultdict(set)
+	database_term_gene_set_dict = defaultdict(lambda: defaultdict(set))
+	for eachline in file_enrichment:
+		item = eachline.strip().split('\t')
+		database = item[0]
+		term = item[1]
+		gene_set = set(item[3].split(','))
+		database_gene_set_dict[database] = database_gene_set_dict[database] | gene_set
+		database_term_gene_set_dict[database][term] = gene_set
+	file_enrichment.close()
+	references['database_gene_set_dict'] = database_gene_set_dict
+	references['database_term_gene_set_dict'] = database_term_gene_set_dict
+	references['geneset'] = None
+	# sha256 of the gene-set file, computed by the enrichment cache when used
+	references['geneset_file'] = os.path.join(data, 'Data_NHC_Geneset.txt')
+	references['geneset_checksum'] = None
+	return references
+
+
+# function for the sha256 checksum of a file
+def file_checksum(filename):
+	checksum = hashlib.sha256()
+	file_in = open(filename, 'rb')
+	block = file_in.read(1048576)
+	while block:
+		checksum.update(block)
+		block = file_in.read(1048576)
+	file_in.close()
+	return checksum.hexdigest()
+
+
+# function for loading the samples and genes of the input file and the
+# principal components of the pc file. The variants of the cases are not
+# kept: the variant store only has the byte span of each (case, gene) pair,
+# from its first row to the end of its last one, so that its memory follows
+# the pairs and not the rows, and the export reads the rows it needs back from
+# the input file (see cluster_variants)
+def load_cohort(filename_input, filename_pc):
+	file_input = open(filename_input, 'rb')
+	input_checksum = hashlib.sha256()
+	eachline = file_input.readline()
+	input_checksum.update(eachline)
+	input_header = eachline.decode().replace('\r\n', '\n')
+	offset = len(eachline)
+	case_set = set()
+	case_gene_set = set()
+	case_gene_set_dict = defaultdict(set)
+	variant_pair_dict = dict()
+	pair_first_array = array.array('q')
+	pair_end_array = array.array('q')
+	ctl_set = set()
+	ctl_gene_set_dict = defaultdict(set)
+	for eachline in file_input:
+		input_checksum.update(eachline)
+		item = eachline.strip().split(b'\t')
+		group = item[0]
+		sample = item[1].decode()
+		gene = item[2].decode()
+		if group == b'case':
+			case_set.add(sample)
+			case_gene_set.add(gene)
+			case_gene_set_dict[sample].add(gene)
+			pair_id = variant_pair_dict.setdefault((sample, gene), len(variant_pair_dict))
+			if pair_id == len(pair_first_array):
+				pair_first_array.append(offset)
+				pair_end_array.append(0)
+			pair_end_array[pair_id] = offset + len(eachline)
+		elif group == b'control':
+			ctl_set.add(sample)
+			ctl_gene_set_dict[sample].add(gene)
+		offset += len(eachline)
+	case_list = list(case_set)
+	case_list.sort()
+	ctl_list = list(ctl_set)
+	ctl_list.sort()
+	file_input.close()
+
+	# the rows of each (case, gene) pair lie in the bytes
+	# [pair_first[pair_id], pair_end[pair_id]) of the input file, among rows of
+	# other pairs when the file does not group them
+	variant_store = dict()
+	variant_store['filename'] = filename_input
+	variant_store['file_stat'] = (os.stat(filename_input).st_size, os.stat(filename_input).st_mtime_ns)
+	variant_store['pair_dict'] = variant_pair_dict
+	variant_store['pair_first'] = np.frombuffer(pair_first_array, dtype=np.int64)
+	variant_store['pair_end'] = np.frombuffer(pair_end_array, dtype=np.int64)
+	# the number of distinct variants of each pair, -1 until read back
+	variant_store['variant_count'] = np.full(len(variant_pair_dict), -1, dtype=np.int32)
+
+	file_pc = open(filename_pc, 'r')
+	file_pc.readline()
+	pc_dict = dict()
+	for eachline in file_pc:
+		item = eachline.strip().split('\t')
+		sample = item[0]
+		pc1 = item[1]
+		pc2 = item[2]
+		pc3 = item[3]
+		pc_dict[sample] = pc1 + '\t' + pc2 + '\t' + pc3
+	file_pc.close()
+
+	cohort = dict()
+	cohort['input_header'] = input_header
+	cohort['case_list'] = case_list
+	cohort['ctl_list'] = ctl_list
+	cohort['case_gene_set'] = case_gene_set
+	cohort['case_gene_set_dict'] = case_gene_set_dict
+	cohort['variant_store'] = variant_store
+	cohort['ctl_gene_set_dict'] = ctl_gene_set_dict
+	# inverted index from genes to the controls carrying them, built by
+	# control_gene_index when mode 2 first needs it
+	cohort['ctl_gene_index'] = None
+	cohort['pc_dict'] = pc_dict
+	cohort['input_checksum'] = input_checksum.hexdigest()
+	cohort['pc_checksum'] = file_checksum(filename_pc)
+	return cohort
+
+
+# function for the network among the case genes: edges of at least edge_cutoff,
+# without hub genes of at least hub_cutoff connectivity unless hub_cutoff is 0
+def filter_network(references, cohort, edge_cutoff, hub_cutoff):
+	return nhc_reference.case_network(references['network'], cohort['case_gene_set'], edge_cutoff, hub_cutoff)
+
+
+# function for the neighbor index of the filtered network: case genes are
+# numbered and each gene keeps its neighbors sorted by decreasing edge weight,
+# so that gene clustering only walks the real edges of the genes already in a
+# cluster. The approximate mode keeps only the topk strongest edges of each
+# gene (all with topk 0), and stops an expansion once its strongest edge to a
+# remaining case is below stop_edge (never with stop_edge 0).
+def build_network_index(cohort, case_network_dict, topk=0, stop_edge=0):
+	case_list = cohort['case_list']
+	case_gene_set_dict = cohort['case_gene_set_dict']
+	case_gene_list = list(cohort['case_gene_set'])
+	case_gene_list.sort()
+	gene_id_dict = dict()
+	for gene_id in range(len(case_gene_list)):
+		gene_id_dict[case_gene_list[gene_id]] = gene_id
+	gene_neighbor_list = [list() for gene_id in range(len(case_gene_list))]
+	for gene_pair in case_network_dict:
+		geneA = gene_pair[0]
+		geneB = gene_pair[1]
+		edge = case_network_dict[gene_pair]
+		# pairs are looked up as (smaller gene, larger gene), so a pair stored
+		# the other way round in the network file is never reached
+		if geneA < geneB and edge > 0:
+			gene_neighbor_list[gene_id_dict[geneA]].append((gene_id_dict[geneB], edge))
+			gene_neighbor_list[gene_id_dict[geneB]].append((gene_id_dict[geneA], edge))
+	for neighbor_list in gene_neighbor_list:
+		neighbor_list.sort(key=lambda x: -x[1])
+		if topk > 0:
+			del neighbor_list[topk:]
+
+	# genes of each case as gene IDs, in the iteration order of the case gene
+	# set (the seed order of gene clustering), with the rank of each gene in
+	# that order, used to break ties between equally strong edges into the same
+	# case, and as a bitmask over gene IDs for the overlap with a cluster.
+	# Every case:gene pair gets a slot, the offset of its case plus its rank.
+	case_gene_id_list = list()
+	case_gene_rank_list = list()
+	case_gene_mask_list = list()
+	case_slot_offset = list()
+	slot_count = 0
+	for sample in case_list:
+		gene_id_list = [gene_id_dict[gene] for gene in case_gene_set_dict[sample]]
+		gene_rank_dict = dict()
+		gene_mask = 0
+		for rank in range(len(gene_id_list)):
+			gene_rank_dict[gene_id_list[rank]] = rank
+			gene_mask |= 1 << gene_id_list[rank]
+		case_gene_id_list.append(gene_id_list)
+		case_gene_rank_list.append(gene_rank_dict)
+		case_gene_mask_list.append(gene_mask)
+		case_slot_offset.append(slot_count)
+		slot_count += len(gene_id_list)
+
+	# inverted index from each case gene to the indices of the cases carrying
+	# it, and to the slots of those case:gene pairs
+	gene_case_index_list = [list() for gene_id in range(len(case_gene_list))]
+	gene_case_slot_list = [list() for gene_id in range(len(case_gene_list))]
+	for case_index in range(len(case_list)):
+		for rank in range(len(case_gene_id_list[case_index])):
+			gene_id = case_gene_id_list[case_index][rank]
+			gene_case_index_list[gene_id].append(case_index)
+			gene_case_slot_list[gene_id].append(case_slot_offset[case_index] + rank)
+
+	index = dict()
+	index['case_list'] = case_list
+	index['case_gene_list'] = case_gene_list
+	index['gene_id_dict'] = gene_id_dict
+	index['gene_neighbor_list'] = gene_neighbor_list
+	index['case_gene_id_list'] = case_gene_id_list
+	index['case_gene_rank_list'] = case_gene_rank_list
+	index['case_gene_mask_list'] = case_gene_mask_list
+	index['case_slot_offset'] = case_slot_offset
+	index['gene_case_index_list'] = gene_case_index_list
+	index['gene_case_slot_list'] = gene_case_slot_list
+	# one byte per case:gene slot, set once the pair was taken by a cluster;
+	# carried over seeds in boost mode
+	index['case_gene_visited'] = bytearray(slot_count)
+	index['stop_edge'] = stop_edge
+	# seeds of an earlier run to take over instead of expanding them, as case
+	# -> {seed gene: (cluster genes in order, cluster line)}, set by cluster_genes
+	index['reuse_seed_dict'] = None
+	# finished expansions by seed gene ID, as (cluster genes in order, cluster
+	# line), filled by gene_clustering (see there), with one copy of each line
+	index['expansion_memo_dict'] = dict()
+	index['expansion_line_dict'] = dict()
+	# neighbor entries read and iterations of every expansion, for the profile
+	index['counter_dict'] = defaultdict(int)
+	index['expansion_step_list'] = list()
+	return index
+
+
+# function for the visited case:gene pairs of the index as (case, gene) names,
+# the form in which checkpoints keep them, since slots follow the iteration
+# order of the case gene sets and may differ from one process to the next
+def visited_case_gene_list(index):
+	case_list = index['case_list']
+	case_gene_list = index['case_gene_list']
+	slot_array = np.flatnonzero(np.frombuffer(index['case_gene_visited'], dtype=np.uint8))
+	case_index_array = np.searchsorted(index['case_slot_offset'], slot_array, side='right') - 1
+	case_gene_pair_list = list()
+	for slot, case_index in zip(slot_array.tolist(), case_index_array.tolist()):
+		gene_id = index['case_gene_id_list'][case_index][slot - index['case_slot_offset'][case_index]]
+		case_gene_pair_list.append((case_list[case_index], case_gene_list[gene_id]))
+	return case_gene_pair_list
+
+
+# function for marking (case, gene) pairs as visited in the index
+def mark_visited_case_gene(index, case_gene_pair_list):
+	case_index_dict = dict()
+	for case_index in range(len(index['case_list'])):
+		case_index_dict[index['case_list'][case_index]] = case_index
+	for case, gene in case_gene_pair_list:
+		case_index = case_index_dict[case]
+		gene_rank = index['case_gene_rank_list'][case_index][index['gene_id_dict'][gene]]
+		index['case_gene_visited'][index['case_slot_offset'][case_index] + gene_rank] = 1
 
 
 ###
 # (3) Gene Clustering
 ###
-print('>> Gene Clustering')
-
-global_clusters = set()
-global_cluster_result = list()
-global_case_gene_visited = set()
-file_out_initial = open(path+output_folder+'/temp_clusters_initial.txt', 'w')
 
-
-# function for gene clustering
-def gene_clustering(cur_index):
+# function for the strongest edge from a gene in the cluster to a gene of the
+# checking case, only edges stronger than highest_edge are of interest; among
+# equally strong edges the gene that comes first in the case gene set wins,
+# in boost mode visited genes of the checking case are skipped
+def closest_neighbor(index, existing_gene, checking_index, highest_edge, skip_visited):
+	case_gene_list = index['case_gene_list']
+	case_gene_visited = index['case_gene_visited']
+	checking_gene_rank = index['case_gene_rank_list'][checking_index]
+	checking_offset = index['case_slot_offset'][checking_index]
+	closest_edge = 0
+	closest_id = -1
+	lookup_count = 0
+	for neighbor_id, neighbor_edge in index['gene_neighbor_list'][index['gene_id_dict'][existing_gene]]:
+		lookup_count += 1
+		if neighbor_edge <= highest_edge or neighbor_edge < closest_edge:
+			break
+		if neighbor_id in checking_gene_rank:
+			if skip_visited and case_gene_visited[checking_offset + checking_gene_rank[neighbor_id]]:
+				continue
+			if closest_id == -1 or checking_gene_rank[neighbor_id] < checking_gene_rank[closest_id]:
+				closest_edge = neighbor_edge
+				closest_id = neighbor_id
+	index['counter_dict']['network_lookups'] += lookup_count
+	if closest_id == -1:
+		return 0, ''
+	return closest_edge, case_gene_list[closest_id]
+
+
+# function for the greedy expansion of one seed gene; at every step the
+# lowest-indexed remaining case that shares a gene with the cluster is taken,
+# otherwise the remaining case with the strongest edge to the cluster (lowest
+# index first on ties) brings its gene in. Both are kept in heaps that are
+# only updated from the cases and neighbors of the gene that was just added.
+# Returns the genes of the cluster in the order they were added and its cases.
+def gene_expansion(index, cur_index, cur_gene, skip_visited):
+	case_list = index['case_list']
+	gene_id_dict = index['gene_id_dict']
+	gene_neighbor_list = index['gene_neighbor_list']
+	gene_case_index_list = index['gene_case_index_list']
+	gene_case_slot_list = index['gene_case_slot_list']
+	case_gene_visited = index['case_gene_visited']
 	cur_case = case_list[cur_index]
-	cur_case_gene_set = case_gene_set_dict[cur_case]
-	for cur_gene in cur_case_gene_set:
-		this_gene_set = set()
-		this_gene_set.add(cur_gene)
-		this_case_set = set()
-		this_case_set.add(cur_case)
-		checking_index_set = set(range(len(case_list)))
-		checking_index_set.remove(cur_index)
-
-		while checking_index_set:
-			closest_index = -1
-			closest_case = ''
-			closest_gene = ''
-			overlap = False
-			highest_edge = 0
-			for checking_index in checking_index_set:
-				checking_case = case_list[checking_index]
-				checking_gene_set = case_gene_set_dict[checking_case]
-				overlap_gene_set = this_gene_set & checking_gene_set
-				if overlap_gene_set:
-					closest_index = checking_index
-					closest_case = checking_case
-					overlap = True
-					break
+	this_gene_set = set()
+	this_gene_list = list()
+	this_gene_mask = 0
+	this_case_set = set()
+	this_case_set.add(cur_case)
+	checking_flag = [True] * len(case_list)
+	checking_flag[cur_index] = False
+	checking_count = len(case_list) - 1
+	overlap_heap = list()
+	edge_heap = list()
+	case_edge_dict = dict()
+	case_edge_gene_dict = dict()
+	step_count = 0
+	lookup_count = 0
+
+	new_gene = cur_gene
+	while True:
+		step_count += 1
+		if new_gene is not None:
+			this_gene_set.add(new_gene)
+			this_gene_list.append(new_gene)
+			new_gene_id = gene_id_dict[new_gene]
+			this_gene_mask |= 1 << new_gene_id
+			lookup_count += len(gene_neighbor_list[new_gene_id])
+			for checking_index in gene_case_index_list[new_gene_id]:
+				if checking_flag[checking_index]:
+					heapq.heappush(overlap_heap, checking_index)
+			for neighbor_id, neighbor_edge in gene_neighbor_list[new_gene_id]:
+				if skip_visited:
+					checking_index_list = [checking_index for checking_index, checking_slot in
+										   zip(gene_case_index_list[neighbor_id], gene_case_slot_list[neighbor_id])
+										   if not case_gene_visited[checking_slot]]
 				else:
-					for existing_gene in this_gene_set:
-						for checking_gene in checking_gene_set:
-							if existing_gene < checking_gene:
-								checking_pair = (existing_gene, checking_gene)
-							else:
-								checking_pair = (checking_gene, existing_gene)
-							temp_edge = 0
-							if checking_pair in case_network_dict.keys():
-								temp_edge = case_network_dict[checking_pair]
-							if temp_edge > highest_edge:
-								closest_index = checking_index
-								closest_case = checking_case
-								closest_gene = checking_gene
-								highest_edge = temp_edge
-
-			if overlap:
-				checking_index_set.remove(closest_index)
-				this_case_set.add(closest_case)
-			elif closest_index != -1:
-				checking_index_set.remove(closest_index)
-				this_case_set.add(closest_case)
-				this_gene_set.add(closest_gene)
-			else:
+					checking_index_list = gene_case_index_list[neighbor_id]
+				for checking_index in checking_index_list:
+					if checking_flag[checking_index]:
+						checking_edge = case_edge_dict.get(checking_index, 0)
+						if neighbor_edge > checking_edge:
+							case_edge_dict[checking_index] = neighbor_edge
+							case_edge_gene_dict[checking_index] = set()
+							case_edge_gene_dict[checking_index].add(new_gene)
+							heapq.heappush(edge_heap, (-neighbor_edge, checking_index))
+						elif neighbor_edge == checking_edge:
+							case_edge_gene_dict[checking_index].add(new_gene)
+			new_gene = None
+
+		if checking_count == 0:
+			break
+		while overlap_heap and not checking_flag[overlap_heap[0]]:
+			heapq.heappop(overlap_heap)
+		while edge_heap and not checking_flag[edge_heap[0][1]]:
+			heapq.heappop(edge_heap)
+
+		if overlap_heap:
+			closest_index = heapq.heappop(overlap_heap)
+			closest_case = case_list[closest_index]
+			checking_flag[closest_index] = False
+			checking_count -= 1
+			this_case_set.add(closest_case)
+			if skip_visited:
+				# the genes both in the cluster and in the case are the set bits
+				# of the intersection of their masks, taken lowest bit first
+				overlap_mask = this_gene_mask & index['case_gene_mask_list'][closest_index]
+				closest_offset = index['case_slot_offset'][closest_index]
+				closest_gene_rank = index['case_gene_rank_list'][closest_index]
+				while overlap_mask:
+					overlap_bit = overlap_mask & -overlap_mask
+					overlap_mask ^= overlap_bit
+					case_gene_visited[closest_offset + closest_gene_rank[overlap_bit.bit_length() - 1]] = 1
+		elif edge_heap:
+			if -edge_heap[0][0] < index['stop_edge']:
 				break
-
-		if len(this_gene_set) > 2:
-			this_gene_cluster_list = list(this_gene_set)
-			this_gene_cluster_list.sort()
-			this_gene_cluster_output = ';'.join(this_gene_cluster_list)
-			this_case_cluster_list = list(this_case_set)
-			this_case_cluster_list.sort()
-			this_case_cluster_output = ';'.join(this_case_cluster_list)
-			if this_gene_cluster_output not in global_clusters:
-				global_clusters.add(this_gene_cluster_output)
-				this_cluster_result = (str(len(this_gene_set))+'\t'+this_gene_cluster_output+'\t'+
-									   str(len(this_case_set))+'\t'+this_case_cluster_output)
-				global_cluster_result.append(this_cluster_result)
+			closest_index = heapq.heappop(edge_heap)[1]
+			closest_case = case_list[closest_index]
+			# among the cluster genes holding this edge, the one that comes
+			# first in the cluster set decides which gene of the case is taken
+			closest_gene = ''
+			for existing_gene in this_gene_set:
+				if existing_gene in case_edge_gene_dict[closest_index]:
+					closest_gene = closest_neighbor(index, existing_gene, closest_index, 0, skip_visited)[1]
+					break
+			checking_flag[closest_index] = False
+			checking_count -= 1
+			this_case_set.add(closest_case)
+			if skip_visited:
+				case_gene_visited[index['case_slot_offset'][closest_index] +
+								  index['case_gene_rank_list'][closest_index][gene_id_dict[closest_gene]]] = 1
+			new_gene = closest_gene
+		else:
+			break
+	index['counter_dict']['network_lookups'] += lookup_count
+	index['expansion_step_list'].append(step_count)
+	return this_gene_list, this_case_set
+
+
+# function for the result of one seed expansion: the seed gene, the genes of
+# its cluster in the order they were added and, for clusters of more than two
+# genes, the line of temp_clusters_initial.txt (None otherwise)
+def seed_result(cur_gene, this_gene_list, this_case_set):
+	this_gene_cluster_list = list(this_gene_list)
+	this_gene_cluster_list.sort()
+	this_gene_cluster_output = ';'.join(this_gene_cluster_list)
+	this_cluster_result = None
+	if len(this_gene_list) > 2:
+		this_case_cluster_list = list(this_case_set)
+		this_case_cluster_list.sort()
+		this_case_cluster_output = ';'.join(this_case_cluster_list)
+		this_cluster_result = (str(len(this_gene_list))+'\t'+this_gene_cluster_output+'\t'+
+							   str(len(this_case_set))+'\t'+this_case_cluster_output)
+	return cur_gene, ';'.join(this_gene_list), this_cluster_result
+
+
+# function for gene clustering, returns the seed_result of every seed gene of
+# the case in seed order; seeds found in the reused seeds of the index (see
+# reusable_seeds) are taken from there instead of being expanded again.
+# Expansions are memoized on their state after the first step: the seed gene
+# has joined and every case carrying it has been taken through the overlap,
+# whichever of them the seed came from. The rest of the walk only depends on
+# the genes added so far, in their order, and the cases carrying them, so
+# every seed of a gene after the first takes the cluster of the first.
+def gene_clustering(index, cur_index):
+	seed_result_list = list()
+	reuse_seed_dict = dict()
+	if index['reuse_seed_dict'] is not None:
+		reuse_seed_dict = index['reuse_seed_dict'].get(index['case_list'][cur_index], reuse_seed_dict)
+	expansion_memo_dict = index['expansion_memo_dict']
+	for cur_gene_id in index['case_gene_id_list'][cur_index]:
+		cur_gene = index['case_gene_list'][cur_gene_id]
+		if cur_gene in reuse_seed_dict:
+			seed_result_list.append((cur_gene,) + reuse_seed_dict[cur_gene])
+			expansion_memo_dict[cur_gene_id] = reuse_seed_dict[cur_gene]
+			index['counter_dict']['seeds_reused'] += 1
+			continue
+		if cur_gene_id in expansion_memo_dict:
+			seed_result_list.append((cur_gene,) + expansion_memo_dict[cur_gene_id])
+			index['counter_dict']['expansion_memo_hits'] += 1
+			continue
+		this_gene_list, this_case_set = gene_expansion(index, cur_index, cur_gene, False)
+		cur_gene, this_gene_order_output, this_cluster_result = seed_result(cur_gene, this_gene_list, this_case_set)
+		if this_cluster_result is not None:
+			this_cluster_result = index['expansion_line_dict'].setdefault(this_cluster_result, this_cluster_result)
+		seed_result_list.append((cur_gene, this_gene_order_output, this_cluster_result))
+		expansion_memo_dict[cur_gene_id] = (this_gene_order_output, this_cluster_result)
+		index['counter_dict']['expansion_memo_misses'] += 1
+	return seed_result_list
 
 
 # function for gene clustering (boost)
-def gene_clustering_boost(cur_index):
-	cur_case = case_list[cur_index]
-	cur_case_gene_set = case_gene_set_dict[cur_case]
-	for cur_gene in cur_case_gene_set:
-		this_gene_set = set()
+def gene_clustering_boost(index, cur_index):
+	seed_result_list = list()
+	case_gene_visited = index['case_gene_visited']
+	cur_offset = index['case_slot_offset'][cur_index]
+	cur_case_gene_id_list = index['case_gene_id_list'][cur_index]
+	for cur_rank in range(len(cur_case_gene_id_list)):
+		cur_gene = index['case_gene_list'][cur_case_gene_id_list[cur_rank]]
+		this_gene_list = list()
 		this_case_set = set()
-		cur_case_gene = cur_case + ':' + cur_gene
-		if cur_case_gene not in global_case_gene_visited:
-			global_case_gene_visited.add(cur_case_gene)
-			this_gene_set.add(cur_gene)
-			this_case_set.add(cur_case)
-			checking_index_set = set(range(len(case_list)))
-			checking_index_set.remove(cur_index)
-
-			while checking_index_set:
-				closest_index = -1
-				closest_case = ''
-				closest_gene = ''
-				overlap = False
-				highest_edge = 0
-				for checking_index in checking_index_set:
-					checking_case = case_list[checking_index]
-					checking_gene_set = case_gene_set_dict[checking_case]
-					overlap_gene_set = this_gene_set & checking_gene_set
-					if overlap_gene_set:
-						closest_index = checking_index
-						closest_case = checking_case
-						overlap = True
-						break
-					else:
-						for existing_gene in this_gene_set:
-							for checking_gene in checking_gene_set:
-								checking_case_gene = checking_case + ':' + checking_gene
-								if checking_case_gene not in global_case_gene_visited:
-									if existing_gene < checking_gene:
-										checking_pair = (existing_gene, checking_gene)
-									else:
-										checking_pair = (checking_gene, existing_gene)
-									temp_edge = 0
-									if checking_pair in case_network_dict.keys():
-										temp_edge = case_network_dict[checking_pair]
-									if temp_edge > highest_edge:
-										closest_index = checking_index
-										closest_case = checking_case
-										closest_gene = checking_gene
-										highest_edge = temp_edge
-
-				if overlap:
-					checking_index_set.remove(closest_index)
-					this_case_set.add(closest_case)
-					for each_overlapping_gene in overlap_gene_set:
-						closest_case_gene = closest_case + ':' + each_overlapping_gene
-						global_case_gene_visited.add(closest_case_gene)
-				elif closest_index != -1:
-					checking_index_set.remove(closest_index)
-					this_case_set.add(closest_case)
-					this_gene_set.add(closest_gene)
-					closest_case_gene = closest_case + ':' + closest_gene
-					global_case_gene_visited.add(closest_case_gene)
-				else:
-					break
+		if not case_gene_visited[cur_offset + cur_rank]:
+			case_gene_visited[cur_offset + cur_rank] = 1
+			this_gene_list, this_case_set = gene_expansion(index, cur_index, cur_gene, True)
+		seed_result_list.append(seed_result(cur_gene, this_gene_list, this_case_set))
+	return seed_result_list
 
-		if len(this_gene_set) > 2:
-			this_gene_cluster_list = list(this_gene_set)
-			this_gene_cluster_list.sort()
-			this_gene_cluster_output = ';'.join(this_gene_cluster_list)
-			this_case_cluster_list = list(this_case_set)
-			this_case_cluster_list.sort()
-			this_case_cluster_output = ';'.join(this_case_cluster_list)
-			if this_gene_cluster_output not in global_clusters:
-				global_clusters.add(this_gene_cluster_output)
-				this_cluster_result = (str(len(this_gene_set))+'\t'+this_gene_cluster_output+'\t'+
-									   str(len(this_case_set))+'\t'+this_case_cluster_output)
-				global_cluster_result.append(this_cluster_result)
+
+# index and boost setting of the clustering in progress, set before the pool
+# is forked so that the workers inherit them instead of receiving them with
+# every seed case
+clustering_index = None
+clustering_boost = 'N'
 
 
-# running gene clustering for all cases
-for case_i in range(len(case_list)):
+# function for gene clustering of one seed case, timed for the progress report
+# and returned with the hot-path counters of its expansions
+def gene_clustering_task(cur_index):
+	clustering_index['counter_dict'] = defaultdict(int)
+	clustering_index['expansion_step_list'] = list()
 	start = time.time()
-	if boost == 'N':
-		gene_clustering(case_i)
-	elif boost == 'Y':
-		gene_clustering_boost(case_i)
+	if clustering_boost == 'N':
+		seed_result_list = gene_clustering(clustering_index, cur_index)
+	elif clustering_boost == 'Y':
+		seed_result_list = gene_clustering_boost(clustering_index, cur_index)
 	end = time.time()
-	timecost = str(round(end-start, 3))
-	print('   '+str(case_i+1)+'/'+str(len(case_list))+' '+case_list[case_i]+' ('+timecost+' sec)')
-print('   # Gene Clusters (initial): '+str(len(global_cluster_result))+'\n')
-
-for each_cluster in global_cluster_result:
-	file_out_initial.write(each_cluster + '\n')
-file_out_initial.close()
+	return (seed_result_list, round(end-start, 3), clustering_index['counter_dict'],
+			clustering_index['expansion_step_list'])
+
+
+# function for saving the clustering after its first case_count seed cases:
+# the initial clusters found so far and, in boost mode, the visited case:gene
+# pairs; the file is replaced in one step so that a job stopped while writing
+# keeps the previous checkpoint
+def write_cluster_checkpoint(checkpoint_file, checkpoint_key, case_count, cluster_result_list, case_gene_pair_list):
+	file_checkpoint = open(checkpoint_file + '.tmp', 'w')
+	file_checkpoint.write('key\t' + checkpoint_key + '\n')
+	file_checkpoint.write('cases\t' + str(case_count) + '\n')
+	file_checkpoint.write('clusters\t' + str(len(cluster_result_list)) + '\n')
+	for each_cluster in cluster_result_list:
+		file_checkpoint.write(each_cluster + '\n')
+	file_checkpoint.write('visited\t' + str(len(case_gene_pair_list)) + '\n')
+	for case, gene in case_gene_pair_list:
+		file_checkpoint.write(case + '\t' + gene + '\n')
+	file_checkpoint.flush()
+	os.fsync(file_checkpoint.fileno())
+	file_checkpoint.close()
+	os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+# function for loading a clustering checkpoint, returns None when there is
+# none or when it was written for other inputs or parameters
+def read_cluster_checkpoint(checkpoint_file, checkpoint_key):
+	if not os.path.exists(checkpoint_file):
+		return None
+	file_checkpoint = open(checkpoint_file, 'r')
+	line_list = file_checkpoint.read().split('\n')
+	file_checkpoint.close()
+	if line_list[0] != 'key\t' + checkpoint_key:
+		print('   Ignoring '+checkpoint_file+', written for other inputs or parameters')
+		return None
+	case_count = int(line_list[1].split('\t')[1])
+	cluster_count = int(line_list[2].split('\t')[1])
+	cluster_result_list = line_list[3:3+cluster_count]
+	visited_count = int(line_list[3+cluster_count].split('\t')[1])
+	case_gene_pair_list = [tuple(eachline.split('\t')) for eachline in line_list[4+cluster_count:4+cluster_count+visited_count]]
+	return case_count, cluster_result_list, case_gene_pair_list
+
+
+# function for gene clustering of all cases, returns the initial clusters as
+# lines of temp_clusters_initial.txt, duplicates removed in seed case order;
+# seed cases are independent of each other in non-boost mode and can be spread
+# over a pool of forked processes sharing the loaded data, boost mode carries
+# the visited genes from one seed case to the next and always runs serially.
+# With a checkpoint_file the finished seed cases are saved every
+# checkpoint_interval seconds, and with resume Y a valid checkpoint is loaded
+# so that only the remaining seed cases run. case_range limits the seed cases
+# to a (first, last) block of the case list, as run by a shard.
+# reuse_seed_dict holds the seeds of an earlier run that are not expanded
+# again (see reusable_seeds), and seed_record_list, when given, receives
+# (case, seed gene, cluster genes in the order they were added, cluster line
+# or None) for every seed; it is
+# left incomplete when the clustering resumes from a checkpoint.
+# topk and stop_edge select the approximate mode (see build_network_index).
+def cluster_genes(cohort, case_network_dict, boost, threads, checkpoint_file=None, checkpoint_key='',
+				  checkpoint_interval=600, resume='N', case_range=None, reuse_seed_dict=None, seed_record_list=None,
+				  topk=0, stop_edge=0):
+	global clustering_index
+	global clustering_boost
+	print('>> Gene Clustering')
+	case_list = cohort['case_list']
+	clustering_index = build_network_index(cohort, case_network_dict, topk, stop_edge)
+	clustering_index['reuse_seed_dict'] = reuse_seed_dict
+	clustering_boost = boost
+
+	global_clusters = set()
+	global_cluster_result = list()
+	start_case = 0
+	last_case = len(case_list)
+	if case_range is not None:
+		start_case, last_case = case_range
+	checkpoint = None
+	if checkpoint_file is not None and resume == 'Y':
+		checkpoint = read_cluster_checkpoint(checkpoint_file, checkpoint_key)
+	if checkpoint is not None:
+		start_case, global_cluster_result, case_gene_pair_list = checkpoint
+		mark_visited_case_gene(clustering_index, case_gene_pair_list)
+		for each_cluster in global_cluster_result:
+			global_clusters.add(each_cluster.split('\t')[1])
+		print('   Resuming after '+str(start_case)+'/'+str(len(case_list))+' seed cases from '+checkpoint_file)
+
+	if threads > 1 and boost == 'N':
+		pool = multiprocessing.get_context('fork').Pool(threads)
+		case_result_iter = pool.imap(gene_clustering_task, range(start_case, last_case))
+		profile_counter_dict['worker_processes'] = threads
+	else:
+		pool = None
+		case_result_iter = map(gene_clustering_task, range(start_case, last_case))
+	checkpoint_time = time.time()
+	memo_counter_dict = defaultdict(int)
+	for case_i in range(start_case, last_case):
+		seed_result_list, timecost, counter_dict, expansion_step_list = next(case_result_iter)
+		for each_counter in counter_dict:
+			profile_counter_dict[each_counter] += counter_dict[each_counter]
+			memo_counter_dict[each_counter] += counter_dict[each_counter]
+		if profile_stage_list is not None:
+			profile_expansion_list.extend(expansion_step_list)
+		for cur_gene, this_gene_order_output, this_cluster_result in seed_result_list:
+			if this_cluster_result is not None:
+				this_gene_cluster_output = this_cluster_result.split('\t')[1]
+				if this_gene_cluster_output not in global_clusters:
+					global_clusters.add(this_gene_cluster_output)
+					global_cluster_result.append(this_cluster_result)
+			if seed_record_list is not None:
+				seed_record_list.append((case_list[case_i], cur_gene, this_gene_order_output, this_cluster_result))
+		print('   '+str(case_i+1)+'/'+str(len(case_list))+' '+case_list[case_i]+' ('+str(timecost)+' sec)')
+		if checkpoint_file is not None and checkpoint_interval > 0 and time.time() - checkpoint_time >= checkpoint_interval:
+			write_cluster_checkpoint(checkpoint_file, checkpoint_key, case_i+1, global_cluster_result,
+									 visited_case_gene_list(clustering_index))
+			checkpoint_time = time.time()
+	if pool is not None:
+		pool.close()
+		pool.join()
+	clustering_index = None
+	if boost == 'N':
+		memo_total = memo_counter_dict['expansion_memo_hits'] + memo_counter_dict['expansion_memo_misses']
+		print('   # Seed Expansions: '+str(memo_counter_dict['expansion_memo_misses'])+' run, '+
+			  str(memo_counter_dict['expansion_memo_hits'])+' memoized ('+
+			  str(round(100.0 * memo_counter_dict['expansion_memo_hits'] / max(memo_total, 1), 1))+'% hit rate)')
+	print('   # Gene Clusters (initial): '+str(len(global_cluster_result))+'\n')
+	return global_cluster_result
+
+
+# function for the accuracy report of the approximate mode: seed_count seeds
+# sampled from all case:gene seeds are expanded on the exact index and on the
+# approximate one (topk, stop_edge), each on its own as in non-boost mode, and
+# their clusters compared by the Jaccard index of their genes and of their
+# cases, along with the time of both. The summary and one line per seed go to
+# filename_report; returns the summary as (label, value) pairs
+def approximation_report(cohort, case_network_dict, topk, stop_edge, seed_count, filename_report):
+	print('>> Approximate Mode Report')
+	exact_index = build_network_index(cohort, case_network_dict)
+	approx_index = build_network_index(cohort, case_network_dict, topk, stop_edge)
+	seed_list = list()
+	for case_index in range(len(exact_index['case_list'])):
+		for gene_id in exact_index['case_gene_id_list'][case_index]:
+			seed_list.append((case_index, exact_index['case_gene_list'][gene_id]))
+	generator = np.random.default_rng(approximation_report_seed)
+	sample_list = sorted(generator.choice(len(seed_list), size=min(seed_count, len(seed_list)), replace=False).tolist())
+
+	row_list = list()
+	exact_time = 0.0
+	approx_time = 0.0
+	for k in sample_list:
+		case_index, cur_gene = seed_list[k]
+		start = time.time()
+		exact_gene_list, exact_case_set = gene_expansion(exact_index, case_index, cur_gene, False)
+		middle = time.time()
+		approx_gene_list, approx_case_set = gene_expansion(approx_index, case_index, cur_gene, False)
+		end = time.time()
+		exact_time += middle - start
+		approx_time += end - middle
+		exact_gene_set = set(exact_gene_list)
+		approx_gene_set = set(approx_gene_list)
+		gene_jaccard = len(exact_gene_set & approx_gene_set) / len(exact_gene_set | approx_gene_set)
+		case_jaccard = len(exact_case_set & approx_case_set) / len(exact_case_set | approx_case_set)
+		row_list.append((exact_index['case_list'][case_index], cur_gene, len(exact_gene_set), len(approx_gene_set),
+						 gene_jaccard, case_jaccard, middle - start, end - middle))
+
+	gene_jaccard_array = np.array([row[4] for row in row_list])
+	case_jaccard_array = np.array([row[5] for row in row_list])
+	summary_list = [('Top-k Edges', topk), ('Stop Edge', stop_edge),
+					('Seeds Sampled', str(len(row_list))+'/'+str(len(seed_list)))]
+	if row_list:
+		summary_list += [('Gene Jaccard (mean)', round(float(gene_jaccard_array.mean()), 4)),
+						 ('Gene Jaccard (median)', round(float(np.median(gene_jaccard_array)), 4)),
+						 ('Case Jaccard (mean)', round(float(case_jaccard_array.mean()), 4)),
+						 ('Clusters Identical', round(float((gene_jaccard_array == 1).mean()), 4)),
+						 ('Clusters Recovered (gene Jaccard >= 0.5)', round(float((gene_jaccard_array >= 0.5).mean()), 4)),
+						 ('Exact Time (sec)', round(exact_time, 3)),
+						 ('Approximate Time (sec)', round(approx_time, 3)),
+						 ('Speedup', round(exact_time / max(approx_time, 1e-9), 2))]
+
+	file_report = open(filename_report, 'w')
+	for label, value in summary_list:
+		file_report.write(label+'\t'+str(value)+'\n')
+		print('   '+label+': '+str(value))
+	file_report.write('\nCase\tSeed_Gene\tExact_Gene_Count\tApproximate_Gene_Count\tGene_Jaccard\tCase_Jaccard\t'
+					  'Exact_sec\tApproximate_sec\n')
+	for case, cur_gene, exact_count, approx_count, gene_jaccard, case_jaccard, exact_sec, approx_sec in row_list:
+		file_report.write(case+'\t'+cur_gene+'\t'+str(exact_count)+'\t'+str(approx_count)+'\t'+
+						  str(round(gene_jaccard, 4))+'\t'+str(round(case_jaccard, 4))+'\t'+
+						  str(round(exact_sec, 6))+'\t'+str(round(approx_sec, 6))+'\n')
+	file_report.close()
+	print('')
+	return summary_list
 
 
 ###
 # (4) Gene Cluster Merging
 ###
-print('>> Gene Cluster Merging')
-
-gene_cluster_merging = list()
-case_cluster_merging = list()
-for each_cluster in global_cluster_result:
-	gene_cluster_merging.append(set(each_cluster.split('\t')[1].split(';')))
-	case_cluster_merging.append(set(each_cluster.split('\t')[3].split(';')))
-file_out_merged = open(path+output_folder+'/temp_clusters_merged.txt', 'w')
-
-stable = False
-while not stable:
-	N = len(gene_cluster_merging)
-	overlap_max = 0
-	overlap_max_pair = [-1, -1]
-	overlap_all_in = False
-	for i in range(0, N):
-		for j in range(i+1, N):
-			if gene_cluster_merging[i].issubset(gene_cluster_merging[j]):
-				overlap_max_pair = [i, j]
-				overlap_max = 1
-			elif gene_cluster_merging[j].issubset(gene_cluster_merging[i]):
-				overlap_max_pair = [i, j]
-				overlap_max = 1
+
+# function for merging the initial clusters, returns the merged clusters as
+# lines of temp_clusters_merged.txt.
+# The merging repeatedly takes the pair of clusters with the highest score,
+# 1 when one gene cluster contains the other and the rounded Jaccard index
+# otherwise, and replaces both by their union at the end of the list. Only
+# pairs that share a gene can score above 0, so candidate pairs come from a
+# gene -> cluster index, and the scores sit in two heaps that only get the
+# pairs of the newly merged cluster pushed after each merge. Clusters are
+# numbered in list order, which keeps the order of the old pairwise scan:
+# among containing pairs the last pair wins, among Jaccard scores the first.
+def merge_clusters(cluster_result_list, merge_cutoff):
+	print('>> Gene Cluster Merging')
+
+	gene_cluster_merging = list()
+	case_cluster_merging = list()
+	for each_cluster in cluster_result_list:
+		gene_cluster_merging.append(set(each_cluster.split('\t')[1].split(';')))
+		case_cluster_merging.append(set(each_cluster.split('\t')[3].split(';')))
+
+	merge_gene_dict = dict()
+	merge_case_dict = dict()
+	merge_gene_index_dict = defaultdict(set)
+	subset_heap = list()
+	jaccard_heap = list()
+
+	# function for scoring a new cluster against the clusters sharing its genes
+	def merge_candidate(new_id):
+		new_gene_cluster = merge_gene_dict[new_id]
+		candidate_id_set = set()
+		for each_gene in new_gene_cluster:
+			candidate_id_set |= merge_gene_index_dict[each_gene]
+		for candidate_id in candidate_id_set:
+			i = min(candidate_id, new_id)
+			j = max(candidate_id, new_id)
+			if merge_gene_dict[i].issubset(merge_gene_dict[j]) or merge_gene_dict[j].issubset(merge_gene_dict[i]):
+				heapq.heappush(subset_heap, (-i, -j))
 			else:
-				intersect = len(gene_cluster_merging[i] & gene_cluster_merging[j])
-				union = len(gene_cluster_merging[i] | gene_cluster_merging[j])
+				intersect = len(merge_gene_dict[i] & merge_gene_dict[j])
+				union = len(merge_gene_dict[i] | merge_gene_dict[j])
 				overlap_ratio = round(float(intersect) / float(union), 3)
-				if overlap_ratio > overlap_max:
-					overlap_max_pair = [i, j]
-					overlap_max = overlap_ratio
-
-	if overlap_max >= merge_cutoff:
-		stable = False
-		max_i = overlap_max_pair[0]
-		max_j = overlap_max_pair[1]
-
-		new_gene_cluster_merging = gene_cluster_merging[max_i] | gene_cluster_merging[max_j]
-		gene_cluster_merging.append(new_gene_cluster_merging)
-		gene_cluster_merging[max_i] = set()
-		gene_cluster_merging[max_j] = set()
-
-		new_case_cluster_merging = case_cluster_merging[max_i] | case_cluster_merging[max_j]
-		case_cluster_merging.append(new_case_cluster_merging)
-		case_cluster_merging[max_i] = set()
-		case_cluster_merging[max_j] = set()
-
-		temp_gene_cluster_merging = list()
-		for each_gene_cluster_merging in gene_cluster_merging:
-			if each_gene_cluster_merging:
-				temp_gene_cluster_merging.append(each_gene_cluster_merging)
-		gene_cluster_merging = temp_gene_cluster_merging
-
-		temp_case_cluster_merging = list()
-		for each_case_cluster_merging in case_cluster_merging:
-			if each_case_cluster_merging:
-				temp_case_cluster_merging.append(each_case_cluster_merging)
-		case_cluster_merging = temp_case_cluster_merging
+				heapq.heappush(jaccard_heap, (-overlap_ratio, i, j))
+		for each_gene in new_gene_cluster:
+			merge_gene_index_dict[each_gene].add(new_id)
 
-	else:
-		stable = True
-
-if stable:
 	for k in range(0, len(gene_cluster_merging)):
-		merged_gene_cluster_list = list(gene_cluster_merging[k])
+		merge_gene_dict[k] = gene_cluster_merging[k]
+		merge_case_dict[k] = case_cluster_merging[k]
+		merge_candidate(k)
+	next_id = len(gene_cluster_merging)
+
+	stable = False
+	while not stable:
+		profile_counter_dict['merge_iterations'] += 1
+		while subset_heap and (-subset_heap[0][0] not in merge_gene_dict or -subset_heap[0][1] not in merge_gene_dict):
+			heapq.heappop(subset_heap)
+		while jaccard_heap and (jaccard_heap[0][1] not in merge_gene_dict or jaccard_heap[0][2] not in merge_gene_dict):
+			heapq.heappop(jaccard_heap)
+
+		overlap_max = 0
+		if subset_heap:
+			overlap_max = 1
+			max_i = -subset_heap[0][0]
+			max_j = -subset_heap[0][1]
+		elif jaccard_heap:
+			overlap_max = -jaccard_heap[0][0]
+			max_i = jaccard_heap[0][1]
+			max_j = jaccard_heap[0][2]
+
+		if overlap_max > 0 and overlap_max >= merge_cutoff:
+			stable = False
+			merge_gene_dict[next_id] = merge_gene_dict.pop(max_i) | merge_gene_dict.pop(max_j)
+			merge_case_dict[next_id] = merge_case_dict.pop(max_i) | merge_case_dict.pop(max_j)
+			for each_gene in merge_gene_dict[next_id]:
+				merge_gene_index_dict[each_gene].discard(max_i)
+				merge_gene_index_dict[each_gene].discard(max_j)
+			merge_candidate(next_id)
+			next_id += 1
+		else:
+			stable = True
+
+	merged_line_list = list()
+	for k in sorted(merge_gene_dict):
+		merged_gene_cluster_list = list(merge_gene_dict[k])
 		merged_gene_cluster_list.sort()
 		merged_gene_cluster_output = ';'.join(merged_gene_cluster_list)
-		merged_case_cluster_list = list(case_cluster_merging[k])
+		merged_case_cluster_list = list(merge_case_dict[k])
 		merged_case_cluster_list.sort()
 		merged_case_cluster_output = ';'.join(merged_case_cluster_list)
-		file_out_merged.write(str(len(merged_gene_cluster_list))+'\t'+merged_gene_cluster_output+'\t'+
-							  str(len(merged_case_cluster_list))+'\t'+merged_case_cluster_output+'\n')
-print('   # Gene Clusters (merged): '+str(len(gene_cluster_merging))+'\n')
-file_out_merged.close()
+		merged_line_list.append(str(len(merged_gene_cluster_list))+'\t'+merged_gene_cluster_output+'\t'+
+								str(len(merged_case_cluster_list))+'\t'+merged_case_cluster_output)
+	print('   # Gene Clusters (merged): '+str(len(merged_line_list))+'\n')
+	return merged_line_list
 
 
 ###
 # (5) Gene Cluster Enrichment
 ###
-print('>> Gene Cluster Enrichment')
-
-file_in_merged = open(path+output_folder+'/temp_clusters_merged.txt', 'r')
-file_output = open(path+output_folder+'/NHC_output_gene_clusters.txt', 'w')
-file_output.write('Cluster\tGene_Count\tGene_Cluster\tCase_Count\tCase_Cluster\tCluster_pvalue\t'
-				  'MSigDB_Hallmark\tKEGG_Pathway\tReactome_Pathway\tWiki_Pathway\t'
-				  'GO_BiologicalProcess\tGO_MolecularFunction\n')
-
-cluster_id = 0
-gene_cluster_enriched_set = set()
-for eachline in file_in_merged:
-	start = time.time()
-	cluster_id += 1
-	output_cluster_info = 'Cluster_' + str(cluster_id) + '\t' + eachline.strip()
-	item = eachline.strip().split('\t')
-	this_cluster_gene_set = set(item[1].split(';'))
-	this_case_list = item[3].split(';')
-
-	output_cluster_pvalue = '.'
-	if mode == 2:
-		this_ctl_list = list()
-		for each_ctl in ctl_gene_set_dict.keys():
-			if len(this_cluster_gene_set & ctl_gene_set_dict[each_ctl]) > 0:
-				this_ctl_list.append(each_ctl)
-	
-		file_temp_PC = open('temp_pc.txt', 'w')
-		file_temp_PC.write('ID\tPHENOTYPE\tPC1\tPC2\tPC3\tCARRIER\n')
-		for each_case in case_list:
-			if each_case in this_case_list:
-				file_temp_PC.write(each_case + '\t1\t' + pc_dict[each_case] + '\t1\n')
-			else:
-				file_temp_PC.write(each_case + '\t1\t' + pc_dict[each_case] + '\t0\n')
-		for each_ctl in ctl_list:
-			if each_ctl in this_ctl_list:
-				file_temp_PC.write(each_ctl + '\t0\t' + pc_dict[each_ctl] + '\t1\n')
-			else:
-				file_temp_PC.write(each_ctl + '\t0\t' + pc_dict[each_ctl] + '\t0\n')
-		file_temp_PC.close()
-	
-		ro.r("data <- read.table('temp_pc.txt', header=T, sep='\t')")
-		ro.r("fit <- glm(data=data, PHENOTYPE ~ PC1+PC2+PC3+CARRIER, family='binomial')")
-		ro.r("adjusted.pval <- anova(fit, test='LRT')[5, 5]")
-		r_pvalue = ro.r("adjusted.pval")
-		pvalue = r_pvalue[0]
-		pvalue = float('%.3E' % Decimal(pvalue))
-		output_cluster_pvalue = str(pvalue)
 
-
-	output_cluster_enrichment = ''
+# function for the gene sets compiled for enrichment, built once per loaded
+# references: each database becomes a sparse gene x term matrix over a shared
+# gene index, with the term sizes and the database gene set as vectors
+def geneset_matrices(references):
+	from scipy import sparse
+
+	if references['geneset'] is not None:
+		return references['geneset']
+	database_gene_set_dict = references['database_gene_set_dict']
+	database_term_gene_set_dict = references['database_term_gene_set_dict']
+	geneset_gene_set = set()
+	for each_database in database_list:
+		geneset_gene_set = geneset_gene_set | database_gene_set_dict[each_database]
+	geneset_gene_list = list(geneset_gene_set)
+	geneset_gene_list.sort()
+	geneset_gene_id_dict = dict()
+	for gene_id in range(len(geneset_gene_list)):
+		geneset_gene_id_dict[geneset_gene_list[gene_id]] = gene_id
+	database_term_list_dict = dict()
+	database_term_matrix_dict = dict()
+	database_term_size_dict = dict()
+	database_gene_vector_dict = dict()
+	for each_database in database_list:
+		database_term_list = list(database_term_gene_set_dict[each_database].keys())
+		gene_index = list()
+		term_index = list()
+		for term_id in range(len(database_term_list)):
+			for gene in database_term_gene_set_dict[each_database][database_term_list[term_id]]:
+				gene_index.append(geneset_gene_id_dict[gene])
+				term_index.append(term_id)
+		database_term_list_dict[each_database] = database_term_list
+		database_term_matrix_dict[each_database] = sparse.csr_matrix(
+			(np.ones(len(gene_index), dtype=np.int64), (gene_index, term_index)),
+			shape=(len(geneset_gene_list), len(database_term_list)))
+		database_term_size_dict[each_database] = np.asarray(
+			database_term_matrix_dict[each_database].sum(axis=0), dtype=np.int64).ravel()
+		gene_vector = np.zeros(len(geneset_gene_list), dtype=np.int64)
+		for gene in database_gene_set_dict[each_database]:
+			gene_vector[geneset_gene_id_dict[gene]] = 1
+		database_gene_vector_dict[each_database] = gene_vector
+
+	geneset = dict()
+	geneset['geneset_gene_list'] = geneset_gene_list
+	geneset['geneset_gene_id_dict'] = geneset_gene_id_dict
+	geneset['database_term_list_dict'] = database_term_list_dict
+	geneset['database_term_matrix_dict'] = database_term_matrix_dict
+	geneset['database_term_size_dict'] = database_term_size_dict
+	geneset['database_gene_vector_dict'] = database_gene_vector_dict
+	references['geneset'] = geneset
+	return geneset
+
+
+# log-factorial table shared by all hypergeometric probabilities
+log_factorial = np.zeros(1)
+
+
+# function for log binomial coefficients from the log-factorial table
+def log_choose(n, k):
+	return log_factorial[n] - log_factorial[k] - log_factorial[n - k]
+
+
+# function for two-sided Fisher's exact p-values of many 2x2 tables at once,
+# each table given by its overlap, cluster size, term size and total count;
+# the p-value sums the hypergeometric probabilities of all tables with the
+# same margins that are no more likely than the observed one
+def fisher_exact_two_sided(overlap, cluster_size, term_size, total):
+	from scipy import special
+
+	global log_factorial
+	if total.max() >= len(log_factorial):
+		log_factorial = special.gammaln(np.arange(total.max() + 1) + 1)
+	lower = np.maximum(0, cluster_size + term_size - total)
+	upper = np.minimum(cluster_size, term_size)
+	log_total = log_choose(total, cluster_size)
+	log_observed = log_choose(term_size, overlap) + log_choose(total - term_size, cluster_size - overlap) - log_total
+	# tables are summed in groups padded to the power of two (8 at least) above
+	# their own width, so that the p-value of a table does not depend on the
+	# other tables of the batch through the order of the summation
+	width = np.maximum(8, np.left_shift(1, np.frexp(upper - lower)[1]))
+	pvalue = np.zeros(len(overlap))
+	for each_width in np.unique(width).tolist():
+		table_index = np.flatnonzero(width == each_width)
+		chunk = max(1, 4194304 // each_width)
+		for chunk_start in range(0, len(table_index), chunk):
+			s = table_index[chunk_start:chunk_start + chunk]
+			x = lower[s, None] + np.arange(each_width)[None, :]
+			x_valid = x <= upper[s, None]
+			x = np.minimum(x, upper[s, None])
+			log_pmf = (log_choose(term_size[s, None], x) +
+					   log_choose(total[s, None] - term_size[s, None], cluster_size[s, None] - x) - log_total[s, None])
+			x_valid &= log_pmf <= log_observed[s, None] + 1e-7
+			pvalue[s] = np.where(x_valid, np.exp(log_pmf), 0).sum(axis=1)
+	return np.minimum(pvalue, 1.0)
+
+
+# function for the Fisher tests of a batch of gene clusters, the overlap of
+# every cluster with every term of a database comes from one sparse product
+# and only terms sharing a gene with a cluster are tested; returns for each
+# cluster and database a dict of term -> adjusted p-value, in term order
+def enrichment_tests(references, cluster_gene_set_list):
+	from scipy import sparse
+
+	geneset = geneset_matrices(references)
+	geneset_gene_id_dict = geneset['geneset_gene_id_dict']
+	database_gene_set_dict = references['database_gene_set_dict']
+	cluster_index = list()
+	gene_index = list()
+	for k in range(len(cluster_gene_set_list)):
+		for gene in cluster_gene_set_list[k]:
+			if gene in geneset_gene_id_dict:
+				cluster_index.append(k)
+				gene_index.append(geneset_gene_id_dict[gene])
+	cluster_matrix = sparse.csr_matrix(
+		(np.ones(len(gene_index), dtype=np.int64), (cluster_index, gene_index)),
+		shape=(len(cluster_gene_set_list), len(geneset['geneset_gene_list'])))
+	cluster_size = np.array([len(each_gene_set) for each_gene_set in cluster_gene_set_list], dtype=np.int64)
+
+	enrichment_hit_list = [dict() for k in range(len(cluster_gene_set_list))]
 	for each_database in database_list:
-		enrichment_hit = dict()
-		database_gene_set = database_gene_set_dict[each_database]
-		database_term_list = database_term_gene_set_dict[each_database].keys()
+		for k in range(len(cluster_gene_set_list)):
+			enrichment_hit_list[k][each_database] = dict()
+		database_term_list = geneset['database_term_list_dict'][each_database]
 		database_term_size = len(database_term_list)
+		if database_term_size == 0 or len(cluster_gene_set_list) == 0:
+			continue
+		overlap_matrix = (cluster_matrix @ geneset['database_term_matrix_dict'][each_database]).tocoo()
+		order = np.lexsort((overlap_matrix.col, overlap_matrix.row))
+		hit_cluster = overlap_matrix.row[order]
+		hit_term = overlap_matrix.col[order]
+		overlap = overlap_matrix.data[order].astype(np.int64)
+		hit_cluster = hit_cluster[overlap > 0]
+		hit_term = hit_term[overlap > 0]
+		overlap = overlap[overlap > 0]
+		if len(overlap) == 0:
+			continue
+		cluster_in_database = cluster_matrix @ geneset['database_gene_vector_dict'][each_database]
+		term_size = geneset['database_term_size_dict'][each_database][hit_term]
+		total = (cluster_size + len(database_gene_set_dict[each_database]) - cluster_in_database)[hit_cluster]
+		pvalue = fisher_exact_two_sided(overlap, cluster_size[hit_cluster], term_size, total)
+		profile_counter_dict['fisher_tests'] += len(overlap)
+		adj_pvalue = pvalue * database_term_size
+		for hit in np.flatnonzero(adj_pvalue < 0.00001):
+			enrichment_hit_list[hit_cluster[hit]][each_database][database_term_list[hit_term[hit]]] = float(
+				'%.3E' % Decimal(float(adj_pvalue[hit])))
+	return enrichment_hit_list
+
+
+# function for starting the enrichment cache of a run in cache_dir, bounded
+# to cache_size_mb megabytes
+def cache_start(cache_dir, cache_size_mb):
+	global enrichment_cache
+	os.makedirs(cache_dir, exist_ok=True)
+	enrichment_cache = dict()
+	enrichment_cache['folder'] = cache_dir
+	enrichment_cache['size_limit'] = cache_size_mb * 1048576
+	enrichment_cache['hits'] = 0
+	enrichment_cache['misses'] = 0
+	enrichment_cache['evicted'] = 0
+
+
+# function for the cache file of a gene cluster: the sha256 of the cache
+# version, the checksum of the gene-set file and the sorted genes of the cluster
+def cache_file(references, cluster_gene_set):
+	if references['geneset_checksum'] is None:
+		references['geneset_checksum'] = file_checksum(references['geneset_file'])
+	key = text_checksum([enrichment_cache_version, references['geneset_checksum']] + sorted(cluster_gene_set))
+	return os.path.join(enrichment_cache['folder'], key[0:2], key + '.json')
+
+
+# function for removing the least recently used cache files, oldest mtime
+# first, until the cache fits its size limit
+def cache_evict():
+	cache_file_list = list()
+	cache_size = 0
+	for each_folder in os.scandir(enrichment_cache['folder']):
+		if each_folder.is_dir():
+			for each_file in os.scandir(each_folder.path):
+				if not each_file.name.endswith('.json'):
+					continue
+				file_stat = each_file.stat()
+				cache_file_list.append((file_stat.st_mtime_ns, file_stat.st_size, each_file.path))
+				cache_size += file_stat.st_size
+	cache_file_list.sort()
+	for mtime, size, filename in cache_file_list:
+		if cache_size <= enrichment_cache['size_limit']:
+			break
+		try:
+			os.remove(filename)
+			enrichment_cache['evicted'] += 1
+		except FileNotFoundError:
+			pass
+		cache_size -= size
+
+
+# function for the cached hits of a batch of gene clusters, None for the
+# clusters not in the cache; the files read are marked as used
+def cache_read(references, cluster_gene_set_list):
+	enrichment_hit_list = [None] * len(cluster_gene_set_list)
+	miss_count = 0
+	for k in range(len(cluster_gene_set_list)):
+		filename = cache_file(references, cluster_gene_set_list[k])
+		try:
+			file_cache = open(filename, 'r')
+			enrichment_hit_list[k] = json.load(file_cache)
+			file_cache.close()
+			os.utime(filename)
+		except (OSError, ValueError):
+			miss_count += 1
+	enrichment_cache['hits'] += len(cluster_gene_set_list) - miss_count
+	enrichment_cache['misses'] += miss_count
+	profile_counter_dict['cache_hits'] += len(cluster_gene_set_list) - miss_count
+	profile_counter_dict['cache_misses'] += miss_count
+	return enrichment_hit_list
+
+
+# function for writing the hits of a gene cluster to the cache, replacing its
+# file in one step so that concurrent runs never read half a file
+def cache_write(references, cluster_gene_set, enrichment_hit):
+	filename = cache_file(references, cluster_gene_set)
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	file_cache = open(filename + '.' + str(os.getpid()) + '.tmp', 'w')
+	json.dump(enrichment_hit, file_cache)
+	file_cache.close()
+	os.replace(filename + '.' + str(os.getpid()) + '.tmp', filename)
+
+
+# function for the enrichment of a batch of gene clusters; with the
+# enrichment cache started, the hits of a cluster tested before are read from
+# its cache file, only the other clusters are tested and their hits written
+# to the cache
+def cluster_enrichment(references, cluster_gene_set_list):
+	if enrichment_cache is None:
+		return enrichment_tests(references, cluster_gene_set_list)
+	enrichment_hit_list = cache_read(references, cluster_gene_set_list)
+	miss_list = [k for k in range(len(cluster_gene_set_list)) if enrichment_hit_list[k] is None]
+	if not miss_list:
+		return enrichment_hit_list
+
+	miss_hit_list = enrichment_tests(references, [cluster_gene_set_list[k] for k in miss_list])
+	for k, enrichment_hit in zip(miss_list, miss_hit_list):
+		enrichment_hit_list[k] = enrichment_hit
+		cache_write(references, cluster_gene_set_list[k], enrichment_hit)
+	cache_evict()
+	return enrichment_hit_list
+
+
+# function for the inverse logit link and its derivative, clamped like R
+def logit_inverse(eta):
+	eta_exp = np.exp(np.clip(eta, -30, 30))
+	eta_exp[eta < -30] = np.finfo(float).eps
+	eta_exp[eta > 30] = 1 / np.finfo(float).eps
+	mu = eta_exp / (1 + eta_exp)
+	mu_eta = eta_exp / (1 + eta_exp) ** 2
+	mu_eta[np.abs(eta) > 30] = np.finfo(float).eps
+	return mu, mu_eta
+
+
+# function for the binomial deviance of 0/1 outcomes
+def binomial_deviance(phenotype, mu):
+	return -2 * (np.log(mu) * phenotype + np.log(1 - mu) * (1 - phenotype)).sum(axis=-1)
+
+
+# function for the deviances of a batch of logistic regressions sharing the
+# outcome, fitted by IRLS with the starting values, convergence rule and
+# iteration limit of R's glm.fit; design_matrix is fits x samples x terms
+def logistic_deviance(design_matrix, phenotype):
+	fit_count = design_matrix.shape[0]
+	mu = np.tile((phenotype + 0.5) / 2, (fit_count, 1))
+	eta = np.log(mu / (1 - mu))
+	mu, mu_eta = logit_inverse(eta)
+	deviance = binomial_deviance(phenotype, mu)
+	active = np.arange(fit_count)
+	for iteration in range(25):
+		weight = mu_eta[active] ** 2 / (mu[active] * (1 - mu[active]))
+		z = eta[active] + (phenotype - mu[active]) / mu_eta[active]
+		design_weighted = design_matrix[active].transpose(0, 2, 1) * weight[:, None, :]
+		coef = np.linalg.solve(design_weighted @ design_matrix[active], (design_weighted @ z[:, :, None]))
+		eta[active] = (design_matrix[active] @ coef)[:, :, 0]
+		mu[active], mu_eta[active] = logit_inverse(eta[active])
+		new_deviance = binomial_deviance(phenotype, mu[active])
+		converged = np.abs(new_deviance - deviance[active]) / (np.abs(new_deviance) + 0.1) < 1e-8
+		deviance[active] = new_deviance
+		active = active[~converged]
+		if len(active) == 0:
+			break
+	return deviance
+
+
+# function for the inverted index from each gene to the indices of the
+# controls carrying it, in ctl_list order
+def control_gene_index(cohort):
+	if cohort['ctl_gene_index'] is not None:
+		return cohort['ctl_gene_index']
+	ctl_list = cohort['ctl_list']
+	ctl_gene_set_dict = cohort['ctl_gene_set_dict']
+	gene_ctl_index_dict = defaultdict(list)
+	for ctl_index in range(len(ctl_list)):
+		for gene in ctl_gene_set_dict[ctl_list[ctl_index]]:
+			gene_ctl_index_dict[gene].append(ctl_index)
+	ctl_gene_index = dict()
+	for gene in gene_ctl_index_dict:
+		ctl_gene_index[gene] = np.array(gene_ctl_index_dict[gene], dtype=np.int64)
+	cohort['ctl_gene_index'] = ctl_gene_index
+	return ctl_gene_index
+
+
+# function for the carrier status of every sample in every cluster, cases
+# then controls: the cases of a cluster are its carriers, a control carries
+# the cluster when it carries any of its genes, found from the union of the
+# control lists of those genes. The matrix is uint8, one byte per cluster and
+# sample, and its users cast the rows they work on to float
+def cluster_carrier_matrix(cohort, merged_line_list, merged_gene_set_list):
+	case_list = cohort['case_list']
+	ctl_gene_index = control_gene_index(cohort)
+	case_index_dict = dict()
+	for case_index in range(len(case_list)):
+		case_index_dict[case_list[case_index]] = case_index
+	carrier_matrix = np.zeros((len(merged_line_list), len(case_list) + len(cohort['ctl_list'])), dtype=np.uint8)
+	for k in range(len(merged_line_list)):
+		for each_case in merged_line_list[k].strip().split('\t')[3].split(';'):
+			carrier_matrix[k, case_index_dict[each_case]] = 1
+		for gene in merged_gene_set_list[k]:
+			if gene in ctl_gene_index:
+				carrier_matrix[k, len(case_list) + ctl_gene_index[gene]] = 1
+	return carrier_matrix
+
+
+# function for the association of carrier status with the phenotype in mode 2,
+# adjusted for the three PCs: the PC design matrix is built once, each cluster
+# only adds its CARRIER column, and the p-value is the likelihood-ratio test of
+# that column as in anova(fit, test='LRT'); clusters whose carrier column is
+# constant cannot be fitted and get nan, like the NA from R
+def carrier_association(carrier_matrix, phenotype, pc_matrix):
+	from scipy import special
+
+	base_matrix = np.column_stack((np.ones(len(phenotype)), pc_matrix))
+	base_deviance = logistic_deviance(base_matrix[None, :, :], phenotype)[0]
+	pvalue = np.full(len(carrier_matrix), np.nan)
+	fitted = np.flatnonzero(carrier_matrix.min(axis=1) != carrier_matrix.max(axis=1))
+	profile_counter_dict['glm_fits'] += 1 + len(fitted)
+	chunk = max(1, 1048576 // len(phenotype))
+	for chunk_start in range(0, len(fitted), chunk):
+		chunk_index = fitted[chunk_start:chunk_start + chunk]
+		design_matrix = np.concatenate((np.broadcast_to(base_matrix, (len(chunk_index),) + base_matrix.shape),
+										carrier_matrix[chunk_index, :, None].astype(float)), axis=2)
+		lrt = np.maximum(base_deviance - logistic_deviance(design_matrix, phenotype), 0)
+		pvalue[chunk_index] = special.erfc(np.sqrt(lrt / 2))
+	return pvalue
+
+
+# function for the same association p-values fitted by R (-glm R), one glm
+# and anova(fit, test='LRT') per cluster; the PCs and phenotype are handed to
+# R once as a data frame and each cluster only replaces its CARRIER column
+def carrier_association_r(carrier_matrix, phenotype, pc_matrix):
+	import rpy2.robjects as ro
+
+	ro.globalenv['data'] = ro.DataFrame({'PHENOTYPE': ro.IntVector(phenotype.astype(int).tolist()),
+										 'PC1': ro.FloatVector(pc_matrix[:, 0].tolist()),
+										 'PC2': ro.FloatVector(pc_matrix[:, 1].tolist()),
+										 'PC3': ro.FloatVector(pc_matrix[:, 2].tolist())})
+	pvalue_list = list()
+	for k in range(len(carrier_matrix)):
+		ro.globalenv['carrier'] = ro.IntVector(carrier_matrix[k].astype(int).tolist())
+		ro.r("data$CARRIER <- carrier")
+		ro.r("fit <- glm(data=data, PHENOTYPE ~ PC1+PC2+PC3+CARRIER, family='binomial')")
+		r_pvalue = ro.r("anova(fit, test='LRT')[5, 5]")
+		profile_counter_dict['r_calls'] += 3
+		pvalue_list.append(r_pvalue[0])
+	return pvalue_list
+
+
+# function for the standardized carrier counts of clusters among the cases
+# for one or more labelings of the samples: the number of carrier cases
+# minus its expectation, over its standard deviation under random labels
+# (the hypergeometric law of drawing case_count samples among them);
+# carrier_count is per cluster and case_carrier_count clusters x labelings
+def carrier_count_z(case_carrier_count, carrier_count, case_count, sample_count):
+	case_share = case_count / sample_count
+	expected = carrier_count * case_share
+	variance = carrier_count * case_share * (1 - case_share) * (sample_count - carrier_count) / max(sample_count - 1, 1)
+	scale = np.zeros(len(carrier_count))
+	scale[variance > 0] = 1 / np.sqrt(variance[variance > 0])
+	return np.abs(case_carrier_count - expected[:, None]) * scale[:, None]
+
+
+# function for the number of carrier cases of every cluster for one or more
+# labelings of the samples (samples x labelings), as clusters x labelings;
+# the uint8 carrier matrix is cast to float a block of clusters at a time
+def carrier_label_count(carrier_matrix, label_matrix):
+	case_carrier_count = np.empty((len(carrier_matrix), label_matrix.shape[1]))
+	block = max(1, permutation_memory // (8 * max(carrier_matrix.shape[1], 1)))
+	for block_start in range(0, len(carrier_matrix), block):
+		case_carrier_count[block_start:block_start + block] = (
+			carrier_matrix[block_start:block_start + block].astype(float) @ label_matrix)
+	return case_carrier_count
+
+
+# function for one chunk of label permutations: permutation_chunk of them,
+# drawn from a generator seeded with the chunk number so that the draws do
+# not depend on how the chunks are spread over processes. Returns, for each
+# cluster, the number of permutations at least as extreme as the observed
+# labels and, for each permutation, the largest statistic over the clusters
+def permutation_task(chunk_index):
+	carrier_matrix = permutation_job['carrier_matrix']
+	phenotype = permutation_job['phenotype']
+	chunk_start = chunk_index * permutation_job['chunk']
+	chunk_size = min(permutation_job['chunk'], permutation_job['permutation_count'] - chunk_start)
+	generator = np.random.default_rng([permutation_seed, chunk_index])
+	label_matrix = generator.permuted(np.broadcast_to(phenotype, (chunk_size, len(phenotype))), axis=1)
+	z = carrier_count_z(carrier_label_count(carrier_matrix, label_matrix.T), permutation_job['carrier_count'],
+						phenotype.sum(), len(phenotype))
+	exceed_count = (z >= permutation_job['observed_z'][:, None] - 1e-9).sum(axis=1)
+	max_z = z.max(axis=0) if len(z) > 0 else np.zeros(chunk_size)
+	return exceed_count, max_z
+
+
+# function for the empirical and family-wise p-values of every cluster from
+# permutation_count permutations of the case/control labels. The statistic
+# is the standardized count of carrier cases (see carrier_count_z), so that
+# all clusters are evaluated for a chunk of permutations at once by one
+# product of the sample x cluster carrier matrix with the permuted labels.
+# The empirical p-value of a cluster is (1 + permutations at least as
+# extreme) / (1 + permutation_count) and the family-wise one compares it to
+# the largest statistic over all clusters of each permutation (single-step
+# max-T); clusters whose carrier status is the same for all samples get nan,
+# like the glm. Chunks run over a pool of threads worker processes.
+def permutation_pvalues(carrier_matrix, phenotype, permutation_count, threads):
+	global permutation_job
+	carrier_count = carrier_matrix.sum(axis=1, dtype=np.int64)
+	observed_z = carrier_count_z(carrier_label_count(carrier_matrix, phenotype[:, None]), carrier_count,
+								 phenotype.sum(), len(phenotype))[:, 0]
+	permutation_job = dict()
+	permutation_job['carrier_matrix'] = carrier_matrix
+	permutation_job['phenotype'] = phenotype
+	permutation_job['carrier_count'] = carrier_count
+	permutation_job['observed_z'] = observed_z
+	permutation_job['permutation_count'] = permutation_count
+	permutation_job['chunk'] = max(1, min(permutation_count, permutation_memory // (8 * max(len(carrier_matrix),
+																						   len(phenotype)))))
+	chunk_count = -(-permutation_count // permutation_job['chunk'])
+	if threads > 1 and chunk_count > 1:
+		pool = multiprocessing.get_context('fork').Pool(threads)
+		chunk_result_iter = pool.imap(permutation_task, range(chunk_count))
+		profile_counter_dict['worker_processes'] = threads
+	else:
+		pool = None
+		chunk_result_iter = map(permutation_task, range(chunk_count))
+	exceed_count = np.zeros(len(carrier_matrix), dtype=np.int64)
+	max_z_list = list()
+	for chunk_exceed_count, chunk_max_z in chunk_result_iter:
+		exceed_count += chunk_exceed_count
+		max_z_list.append(chunk_max_z)
+	if pool is not None:
+		pool.close()
+		pool.join()
+	permutation_job = None
+	profile_counter_dict['permutations'] += permutation_count
+
+	max_z = np.sort(np.concatenate(max_z_list))
+	max_exceed_count = len(max_z) - np.searchsorted(max_z, observed_z - 1e-9, side='left')
+	empirical_pvalue = (1 + exceed_count) / (1 + permutation_count)
+	fwer_pvalue = (1 + max_exceed_count) / (1 + permutation_count)
+	constant = (carrier_count == 0) | (carrier_count == len(phenotype))
+	empirical_pvalue[constant] = np.nan
+	fwer_pvalue[constant] = np.nan
+	return empirical_pvalue, fwer_pvalue
+
+
+# permutation job of the worker pool: the carrier matrix, phenotype, observed
+# statistics and chunking; set by permutation_pvalues before the workers are
+# forked, so that they share it
+permutation_job = None
+
+
+# enrichment job of the worker pool: the gene clusters, the clusters still to
+# test, and in mode 2 with the native glm the carrier matrix, phenotype and
+# PCs; set by parallel_cluster_tests before the workers are forked, so that
+# they share it and the compiled gene sets of the references
+enrichment_job = None
+
+
+# function for the tests of one block of merged clusters in a worker: the
+# enrichment of its clusters not found in the cache and, in mode 2, the
+# association of all of them, returned with the hot-path counters
+def enrichment_task(block):
+	block_start, block_end = block
+	profile_counter_dict.clear()
+	test_list = [k for k in range(block_start, block_end) if enrichment_job['test_flag'][k]]
+	enrichment_hit_list = enrichment_tests(enrichment_job['references'],
+										   [enrichment_job['gene_set_list'][k] for k in test_list])
+	pvalue_list = list()
+	if enrichment_job['carrier_matrix'] is not None:
+		pvalue_list = carrier_association(enrichment_job['carrier_matrix'][block_start:block_end],
+										  enrichment_job['phenotype'], enrichment_job['pc_matrix']).tolist()
+	return test_list, enrichment_hit_list, pvalue_list, dict(profile_counter_dict)
+
+
+# function for the enrichment and native association of the merged clusters
+# over a pool of threads worker processes. The clusters go out in blocks,
+# several per worker so that they stay busy, and the results are taken back
+# in block order as they come in, which keeps the Cluster_N order; the tests
+# of a cluster do not depend on the other clusters of its block. Cache reads
+# and writes stay in this process. Returns the hits and p-values of every
+# cluster (no p-values unless carrier_matrix is given).
+def parallel_cluster_tests(references, cluster_gene_set_list, carrier_matrix, phenotype, pc_matrix, threads):
+	global enrichment_job
+	geneset_matrices(references)
+	if enrichment_cache is None:
+		enrichment_hit_list = [None] * len(cluster_gene_set_list)
+	else:
+		enrichment_hit_list = cache_read(references, cluster_gene_set_list)
+	enrichment_job = dict()
+	enrichment_job['references'] = references
+	enrichment_job['gene_set_list'] = cluster_gene_set_list
+	enrichment_job['test_flag'] = [enrichment_hit is None for enrichment_hit in enrichment_hit_list]
+	enrichment_job['carrier_matrix'] = carrier_matrix
+	enrichment_job['phenotype'] = phenotype
+	enrichment_job['pc_matrix'] = pc_matrix
+
+	block_size = max(enrichment_block_min, -(-len(cluster_gene_set_list) // (threads * enrichment_block_per_worker)))
+	block_list = [(block_start, min(block_start + block_size, len(cluster_gene_set_list)))
+				  for block_start in range(0, len(cluster_gene_set_list), block_size)]
+	pvalue_list = list()
+	pool = multiprocessing.get_context('fork').Pool(threads)
+	profile_counter_dict['worker_processes'] = threads
+	for test_list, test_hit_list, block_pvalue_list, counter_dict in pool.imap(enrichment_task, block_list):
+		for k, enrichment_hit in zip(test_list, test_hit_list):
+			enrichment_hit_list[k] = enrichment_hit
+			if enrichment_cache is not None:
+				cache_write(references, cluster_gene_set_list[k], enrichment_hit)
+		pvalue_list.extend(block_pvalue_list)
+		for each_counter in counter_dict:
+			profile_counter_dict[each_counter] += counter_dict[each_counter]
+	pool.close()
+	pool.join()
+	enrichment_job = None
+	if enrichment_cache is not None:
+		cache_evict()
+	return enrichment_hit_list, pvalue_list
+
+
+# function for the enrichment of the merged clusters and, in mode 2, their
+# association with the phenotype; returns the lines of the cluster table
+# (NHC_output_gene_clusters.txt without its header) and the number of
+# clusters enriched in at least one database
+def enrich_clusters(references, cohort, merged_line_list, mode, glm, threads=1, permutations=0):
+	print('>> Gene Cluster Enrichment')
+	case_list = cohort['case_list']
+	ctl_list = cohort['ctl_list']
+	pc_dict = cohort['pc_dict']
+
+	merged_gene_set_list = list()
+	for eachline in merged_line_list:
+		merged_gene_set_list.append(set(eachline.strip().split('\t')[1].split(';')))
+
+	# mode 2: the carrier status of every sample in every cluster, cases then
+	# controls, tested with the native glm in one batch or with R per cluster
+	carrier_matrix = None
+	phenotype = None
+	pc_matrix = None
+	if mode == 2:
+		sample_list = case_list + ctl_list
+		phenotype = np.array([1] * len(case_list) + [0] * len(ctl_list), dtype=float)
+		pc_matrix = np.array([pc_dict[sample].split('\t') for sample in sample_list], dtype=float)
+		carrier_matrix = cluster_carrier_matrix(cohort, merged_line_list, merged_gene_set_list)
+
+	# with threads, the enrichment and native association run over a worker
+	# pool; R stays in this process, an embedded R cannot be shared by forks
+	merged_pvalue_list = list()
+	if threads > 1 and len(merged_line_list) > enrichment_block_min:
+		native_carrier_matrix = None
+		if mode == 2 and glm == 'native':
+			native_carrier_matrix = carrier_matrix
+		merged_enrichment_hit_list, merged_pvalue_list = parallel_cluster_tests(
+			references, merged_gene_set_list, native_carrier_matrix, phenotype, pc_matrix, threads)
+	else:
+		merged_enrichment_hit_list = cluster_enrichment(references, merged_gene_set_list)
+		if mode == 2 and glm == 'native':
+			merged_pvalue_list = carrier_association(carrier_matrix, phenotype, pc_matrix)
+	if mode == 2 and glm == 'R':
+		merged_pvalue_list = carrier_association_r(carrier_matrix, phenotype, pc_matrix)
+	if mode == 2 and permutations > 0:
+		empirical_pvalue_list, fwer_pvalue_list = permutation_pvalues(carrier_matrix, phenotype, permutations, threads)
+
+	cluster_output_list = list()
+	cluster_id = 0
+	gene_cluster_enriched_set = set()
+	for eachline in merged_line_list:
+		start = time.time()
+		cluster_id += 1
+		output_cluster_info = 'Cluster_' + str(cluster_id) + '\t' + eachline.strip()
+
+		output_cluster_pvalue = '.'
+		if mode == 2:
+			pvalue = merged_pvalue_list[cluster_id-1]
+			pvalue = float('%.3E' % Decimal(float(pvalue)))
+			output_cluster_pvalue = str(pvalue)
+
+		output_cluster_enrichment = ''
+		for each_database in database_list:
+			enrichment_hit = merged_enrichment_hit_list[cluster_id-1][each_database]
+
+			if len(enrichment_hit) == 0:
+				output_cluster_enrichment += '.\t'
+			elif len(enrichment_hit) > 0:
+				gene_cluster_enriched_set.add(cluster_id)
+				enrichment_hit_sorted = sorted(enrichment_hit.items(), key=lambda x: x[1])
+				enrichment_output = ''
+				for each_sorted in enrichment_hit_sorted:
+					term = each_sorted[0]
+					pvalue = each_sorted[1]
+					enrichment_output += term + ' (' + str(pvalue) + ');'
+				output_cluster_enrichment += enrichment_output[0:-1] + '\t'
+		output_cluster_enrichment = output_cluster_enrichment[0:-1]
+		output_cluster_permutation = ''
+		if mode == 2 and permutations > 0:
+			empirical_pvalue = float('%.3E' % Decimal(float(empirical_pvalue_list[cluster_id-1])))
+			fwer_pvalue = float('%.3E' % Decimal(float(fwer_pvalue_list[cluster_id-1])))
+			output_cluster_permutation = '\t'+str(empirical_pvalue)+'\t'+str(fwer_pvalue)
+		cluster_output_list.append(output_cluster_info+'\t'+output_cluster_pvalue+'\t'+output_cluster_enrichment+
+								   output_cluster_permutation)
+
+		end = time.time()
+		timecost = str(round(end-start, 3))
+		print('   ' + str(cluster_id)+'/'+str(len(merged_line_list))+' ('+timecost+' sec)')
+
+	print('   # Gene Clusters (enriched): '+'\t'+str(len(gene_cluster_enriched_set))+'\n')
+	return cluster_output_list, len(gene_cluster_enriched_set)
 
-		for each_term in database_term_list:
-			term_gene_set = database_term_gene_set_dict[each_database][each_term]
-			cluster_in_term_in = this_cluster_gene_set & term_gene_set
-			cluster_in_term_out = this_cluster_gene_set - cluster_in_term_in
-			cluster_out_term_in = term_gene_set - cluster_in_term_in
-			cluster_out_term_out = database_gene_set - this_cluster_gene_set - term_gene_set
-			if len(cluster_in_term_in) != 0:
-				odd, pvalue = stats.fisher_exact([[len(cluster_in_term_in), len(cluster_in_term_out)],
-												  [len(cluster_out_term_in), len(cluster_out_term_out)]],
-												 alternative='two-sided')
-				adj_pvalue = pvalue * database_term_size
-				if adj_pvalue < 0.00001:
-					adj_pvalue = float('%.3E' % Decimal(adj_pvalue))
-					enrichment_hit[each_term] = adj_pvalue
-
-		if len(enrichment_hit) == 0:
-			output_cluster_enrichment += '.\t'
-		elif len(enrichment_hit) > 0:
-			gene_cluster_enriched_set.add(cluster_id)
-			enrichment_hit_sorted = sorted(enrichment_hit.items(), key=lambda x: x[1])
-			enrichment_output = ''
-			for each_sorted in enrichment_hit_sorted:
-				term = each_sorted[0]
-				pvalue = each_sorted[1]
-				enrichment_output += term + ' (' + str(pvalue) + ');'
-			output_cluster_enrichment += enrichment_output[0:-1] + '\t'
-	output_cluster_enrichment = output_cluster_enrichment[0:-1]
-	file_output.write(output_cluster_info+'\t'+output_cluster_pvalue+'\t'+output_cluster_enrichment+'\n')
-
-	end = time.time()
-	timecost = str(round(end-start, 3))
-	print('   ' + str(cluster_id)+'/'+str(len(gene_cluster_merging))+' ('+timecost+' sec)')
-
-print('   # Gene Clusters (enriched): '+'\t'+str(len(gene_cluster_enriched_set))+'\n')
-file_in_merged.close()
-file_output.close()
 
 ###
 # (7) Extracting Variants for Each Cluster
 ###
-print('>> Extracting Variants for Each Cluster\n')
-
-os.system('mkdir -p '+path+output_folder+'/variant_files')
-file_cluster = open(path+output_folder+'/NHC_output_gene_clusters.txt', 'r')
-file_cluster.readline()
-for eachline in file_cluster:
-	item = eachline.strip().split('\t')
-	cluster_id = item[0].lower()
-	gene_cluster = item[2].split(';')
-	case_cluster = item[4].split(';')
-
-	file_var = open(path+output_folder+'/variant_files/NHC_output_gene_'+cluster_id+'_variants.txt', 'w')
-	file_var.write(input_header)
-	for each_gene in gene_cluster:
-		for each_case in case_cluster:
-			var_set = case_gene_var_set_dict[each_case][each_gene]
-			if var_set:
-				for each_var in var_set:
-					file_var.write('case\t'+each_case+'\t'+each_gene+'\t'+each_var+'\n')
-file_cluster.close()
+
+# function for an export file written through a buffer of export_buffer_size
+# bytes, gzip-compressed (with .gz added to its name) when compress is True
+def export_open(filename, compress):
+	if compress:
+		return gzip.open(filename + '.gz', 'wt', compresslevel=6)
+	return open(filename, 'w', buffering=export_buffer_size)
+
+
+# function for the cluster ID, genes and cases of each line of the cluster table
+def cluster_members(cluster_output_list):
+	cluster_member_list = list()
+	for eachline in cluster_output_list:
+		item = eachline.strip().split('\t')
+		cluster_member_list.append((item[0], item[2].split(';'), item[4].split(';')))
+	return cluster_member_list
+
+
+# function for the input file of the variant store, opened to read variants
+# back; raises ValueError when the file changed since it was loaded
+def open_variant_store(cohort):
+	variant_store = cohort['variant_store']
+	file_stat = os.stat(variant_store['filename'])
+	if (file_stat.st_size, file_stat.st_mtime_ns) != variant_store['file_stat']:
+		raise ValueError(variant_store['filename']+' changed since it was loaded, its variants cannot be read back')
+	return open(variant_store['filename'], 'rb')
+
+
+# function for the variants of every (case, gene) pair of one cluster, as
+# (case, gene) -> set of variants; the byte spans of its pairs in the variant
+# store are merged and read back from the input file in order, keeping the
+# case rows of the pairs of the cluster, so that memory follows the variants of
+# one cluster instead of all variants of the input. With the input grouped by
+# case, as written by the pipelines, the spans stay within the rows of the
+# cases of the cluster
+def cluster_variants(cohort, file_input, gene_cluster, case_cluster):
+	variant_store = cohort['variant_store']
+	pair_dict = variant_store['pair_dict']
+	gene_cluster_set = set(gene_cluster)
+	pair_id_list = list()
+	variant_dict = dict()
+	row_pair_dict = dict()
+	for each_case in case_cluster:
+		for each_gene in cohort['case_gene_set_dict'][each_case] & gene_cluster_set:
+			pair_id_list.append(pair_dict[(each_case, each_gene)])
+			variant_dict[(each_case, each_gene)] = set()
+			row_pair_dict[(each_case.encode(), each_gene.encode())] = variant_dict[(each_case, each_gene)]
+	pair_id_array = np.array(pair_id_list, dtype=np.int64)
+	pair_first = variant_store['pair_first'][pair_id_array]
+	pair_end = variant_store['pair_end'][pair_id_array]
+	span_order = np.argsort(pair_first, kind='stable')
+
+	row_count = 0
+	span_list = list()
+	for first, end in zip(pair_first[span_order].tolist(), pair_end[span_order].tolist()):
+		if span_list and first <= span_list[-1][1]:
+			span_list[-1][1] = max(span_list[-1][1], end)
+		else:
+			span_list.append([first, end])
+	for first, end in span_list:
+		file_input.seek(first)
+		position = first
+		while position < end:
+			eachline = file_input.readline()
+			position += len(eachline)
+			row_count += 1
+			item = eachline.strip().split(b'\t', 3)
+			if item[0] == b'case':
+				var_set = row_pair_dict.get((item[1], item[2]))
+				if var_set is not None:
+					var_set.add(item[3].decode() if len(item) == 4 else '')
+	profile_counter_dict['variant_rows_read'] += row_count
+	variant_store['variant_count'][pair_id_array] = [len(var_set) for var_set in variant_dict.values()]
+	return variant_dict
+
+
+# function for the number of distinct variants of every (case, gene) pair of
+# one cluster, read back only when the variant export has not counted them
+def cluster_variant_counts(cohort, file_input, gene_cluster, case_cluster):
+	variant_store = cohort['variant_store']
+	pair_dict = variant_store['pair_dict']
+	variant_count_dict = dict()
+	gene_cluster_set = set(gene_cluster)
+	for each_case in case_cluster:
+		for each_gene in cohort['case_gene_set_dict'][each_case] & gene_cluster_set:
+			variant_count = int(variant_store['variant_count'][pair_dict[(each_case, each_gene)]])
+			if variant_count < 0:
+				variant_dict = cluster_variants(cohort, file_input, gene_cluster, case_cluster)
+				for variant_pair in variant_dict:
+					variant_count_dict[variant_pair] = len(variant_dict[variant_pair])
+				return variant_count_dict
+			variant_count_dict[(each_case, each_gene)] = variant_count
+	return variant_count_dict
+
+
+# function for the variant file of each cluster of the cluster table or, with
+# export table or table.gz, one variant table of all clusters keyed by their
+# cluster ID; only one file is open at a time
+def export_variants(cohort, cluster_output_list, output_dir, export='files'):
+	print('>> Extracting Variants for Each Cluster\n')
+	file_input = open_variant_store(cohort)
+
+	file_table = None
+	if export == 'files':
+		os.system('mkdir -p '+output_dir+'/variant_files')
+	else:
+		file_table = export_open(output_dir+'/NHC_output_variants.txt', export == 'table.gz')
+		file_table.write('Cluster\t'+cohort['input_header'])
+	for cluster_id, gene_cluster, case_cluster in cluster_members(cluster_output_list):
+		variant_dict = cluster_variants(cohort, file_input, gene_cluster, case_cluster)
+		line_list = list()
+		for each_gene in gene_cluster:
+			for each_case in case_cluster:
+				var_set = variant_dict.get((each_case, each_gene))
+				if var_set:
+					for each_var in var_set:
+						line_list.append('case\t'+each_case+'\t'+each_gene+'\t'+each_var+'\n')
+		profile_counter_dict['variant_rows'] += len(line_list)
+		if file_table is not None:
+			for eachline in line_list:
+				file_table.write(cluster_id+'\t'+eachline)
+			continue
+		file_var = export_open(output_dir+'/variant_files/NHC_output_gene_'+cluster_id.lower()+'_variants.txt', False)
+		file_var.write(cohort['input_header'])
+		file_var.writelines(line_list)
+		file_var.close()
+	if file_table is not None:
+		file_table.close()
+	file_input.close()
 
 
 ###
 # (7) Generating Network Files
 ###
-if network == 'Y':
+
+# function for the edges of the filtered network by gene: gene A -> list of
+# (position in case_network_dict, gene B), so that the edges among the genes
+# of a cluster are found from its genes alone, in the order of the network
+def network_edge_index(case_network_dict):
+	gene_edge_dict = defaultdict(list)
+	position = 0
+	for geneA, geneB in case_network_dict:
+		gene_edge_dict[geneA].append((position, geneB))
+		position += 1
+	return gene_edge_dict
+
+
+# function for the network and node files of each cluster of the cluster table
+# or, with export table or table.gz, one network and one node table of all
+# clusters keyed by their cluster ID; at most two files are open at a time
+def export_network(case_network_dict, cohort, cluster_output_list, output_dir, export='files'):
 	print('>> Generating Network Files\n')
+	file_input = open_variant_store(cohort)
+	gene_edge_dict = network_edge_index(case_network_dict)
 
-	os.system('mkdir -p '+path+output_folder+'/network_files')
-	file_cluster = open(path+output_folder+'/NHC_output_gene_clusters.txt', 'r')
-	file_cluster.readline()
-	for eachline in file_cluster:
-		item = eachline.strip().split('\t')
-		cluster_id = item[0].lower()
-		gene_cluster = item[2].split(';')
-		case_cluster = item[4].split(';')
-
-		file_network = open(path+output_folder+'/network_files/NHC_output_gene_'+cluster_id+'_network.csv', 'w')
-		for each_gene_pair in case_network_dict:
-			geneA = each_gene_pair[0]
-			geneB = each_gene_pair[1]
-			if (geneA in gene_cluster) and (geneB in gene_cluster):
-				file_network.write(geneA + '\t' + geneB + '\n')
-
-		file_node = open(path+output_folder+'/network_files/NHC_output_gene_'+cluster_id+'_node.csv', 'w')
-		file_node.write('ID\tCase_Count\tVar_Count\n')
+	file_network = None
+	file_node = None
+	if export == 'files':
+		os.system('mkdir -p '+output_dir+'/network_files')
+	else:
+		file_network = export_open(output_dir+'/NHC_output_network.txt', export == 'table.gz')
+		file_network.write('Cluster\tGene_A\tGene_B\n')
+		file_node = export_open(output_dir+'/NHC_output_nodes.txt', export == 'table.gz')
+		file_node.write('Cluster\tID\tCase_Count\tVar_Count\n')
+	for cluster_id, gene_cluster, case_cluster in cluster_members(cluster_output_list):
+		# the subgraph of the cluster in the filtered network
+		gene_cluster_set = set(gene_cluster)
+		edge_list = list()
+		for geneA in gene_cluster:
+			gene_edge_list = gene_edge_dict.get(geneA, [])
+			profile_counter_dict['network_lookups'] += len(gene_edge_list)
+			for position, geneB in gene_edge_list:
+				if geneB in gene_cluster_set:
+					edge_list.append((position, geneA, geneB))
+		edge_list.sort()
+		edge_line_list = [geneA+'\t'+geneB+'\n' for position, geneA, geneB in edge_list]
+
+		# the number of cases carrying each gene of the cluster and their variants
+		variant_count_dict = cluster_variant_counts(cohort, file_input, gene_cluster, case_cluster)
+		node_line_list = list()
 		for each_gene in gene_cluster:
 			case_count = 0
 			var_count = 0
 			for each_case in case_cluster:
-				if each_gene in case_gene_set_dict[each_case]:
+				if (each_case, each_gene) in variant_count_dict:
 					case_count += 1
-					var_count += len(case_gene_var_set_dict[each_case][each_gene])
-			file_node.write(each_gene+'\t'+str(case_count)+'\t'+str(var_count)+'\n')
-file_cluster.close()
+					var_count += variant_count_dict[(each_case, each_gene)]
+			node_line_list.append(each_gene+'\t'+str(case_count)+'\t'+str(var_count)+'\n')
+
+		if export == 'files':
+			file_cluster_network = export_open(output_dir+'/network_files/NHC_output_gene_'+cluster_id.lower()+
+											   '_network.csv', False)
+			file_cluster_network.writelines(edge_line_list)
+			file_cluster_network.close()
+			file_cluster_node = export_open(output_dir+'/network_files/NHC_output_gene_'+cluster_id.lower()+
+											'_node.csv', False)
+			file_cluster_node.write('ID\tCase_Count\tVar_Count\n')
+			file_cluster_node.writelines(node_line_list)
+			file_cluster_node.close()
+		else:
+			for eachline in edge_line_list:
+				file_network.write(cluster_id+'\t'+eachline)
+			for eachline in node_line_list:
+				file_node.write(cluster_id+'\t'+eachline)
+	if export != 'files':
+		file_network.close()
+		file_node.close()
+	file_input.close()
 
 
 ###
-# (8) The End
+# (8) Running NHC
 ###
 
-global_end = time.time()
-global_timecost = str(round(global_end-global_start, 3))
-print('>> Total Time Cost:'+'\t'+global_timecost+' sec\n')
+# version of the checkpoint files, part of every checkpoint key
+checkpoint_version = '2'
+
+
+# function for the sha256 checksum of a list of strings
+def text_checksum(text_list):
+	return hashlib.sha256('\n'.join(text_list).encode()).hexdigest()
+
+
+# function for the checkpoint keys of the stages of a run; the key of a stage
+# covers the input files, references and parameters its output depends on,
+# through the key of the stage before it
+def checkpoint_keys(references, cohort, edge_cutoff, hub_cutoff, merge_cutoff, boost, mode, glm, permutations=0,
+					topk=0, stop_edge=0):
+	key_dict = dict()
+	key_dict['clustering'] = text_checksum([checkpoint_version, cohort['input_checksum'], references['network_fingerprint'],
+											str(edge_cutoff), str(hub_cutoff), boost])
+	key_dict['seeds'] = text_checksum([checkpoint_version, references['network_fingerprint'], str(edge_cutoff),
+									   str(hub_cutoff)])
+	if topk > 0 or stop_edge > 0:
+		key_dict['clustering'] = text_checksum([key_dict['clustering'], 'approximate', str(topk), str(stop_edge)])
+		key_dict['seeds'] = text_checksum([key_dict['seeds'], 'approximate', str(topk), str(stop_edge)])
+	key_dict['merging'] = text_checksum([key_dict['clustering'], str(merge_cutoff)])
+	key_dict['enrichment'] = text_checksum([key_dict['merging'], references['geneset_fingerprint'],
+											cohort['pc_checksum'], str(mode), glm])
+	if permutations > 0:
+		key_dict['enrichment'] = text_checksum([key_dict['enrichment'], str(permutations), str(permutation_seed)])
+	return key_dict
+
+
+# function for the stages recorded as finished in temp_checkpoint.txt of an
+# output folder, as stage -> key
+def read_stage_checkpoint(output_dir):
+	stage_key_dict = dict()
+	if os.path.exists(output_dir+'/temp_checkpoint.txt'):
+		file_checkpoint = open(output_dir+'/temp_checkpoint.txt', 'r')
+		for eachline in file_checkpoint:
+			item = eachline.strip().split('\t')
+			if len(item) == 2:
+				stage_key_dict[item[0]] = item[1]
+		file_checkpoint.close()
+	return stage_key_dict
+
+
+# function for recording a finished stage once its output file is complete
+def write_stage_checkpoint(output_dir, stage, key):
+	file_checkpoint = open(output_dir+'/temp_checkpoint.txt', 'a')
+	file_checkpoint.write(stage + '\t' + key + '\n')
+	file_checkpoint.flush()
+	os.fsync(file_checkpoint.fileno())
+	file_checkpoint.close()
+
+
+# function for the lines of an output file, without line ends and skipping
+# header_count header lines
+def read_lines(filename, header_count):
+	file_in = open(filename, 'r')
+	line_list = file_in.read().split('\n')[header_count:-1]
+	file_in.close()
+	return line_list
+
+
+# function for starting the profile of the run, stage records are collected
+# from then on
+def profile_start():
+	global profile_stage_list
+	profile_stage_list = list()
+
+
+# function for resetting the peak resident set size of the process, returns
+# False where the kernel does not allow it
+def reset_peak_rss():
+	try:
+		file_clear_refs = open('/proc/self/clear_refs', 'w')
+		file_clear_refs.write('5')
+		file_clear_refs.close()
+		return True
+	except OSError:
+		return False
+
+
+# function for the peak resident set size of the process in MB, since the
+# last reset when there was one
+def read_peak_rss():
+	if os.path.exists('/proc/self/status'):
+		file_status = open('/proc/self/status', 'r')
+		for eachline in file_status:
+			if eachline.startswith('VmHWM:'):
+				file_status.close()
+				return int(eachline.split()[1]) / 1024
+		file_status.close()
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# function for the CPU time of the process and its finished workers
+def cpu_time():
+	cpu = os.times()
+	return cpu.user + cpu.system + cpu.children_user + cpu.children_system
+
+
+# function for the start of a stage, resets the hot-path counters and, when
+# profiling, returns the clock readings the stage record is taken against
+def profile_begin():
+	profile_counter_dict.clear()
+	del profile_expansion_list[:]
+	if profile_stage_list is None:
+		return None
+	begin = dict()
+	begin['rss_reset'] = reset_peak_rss()
+	begin['cpu'] = cpu_time()
+	begin['wall'] = time.time()
+	return begin
+
+
+# function for the record of a stage when profiling: wall and CPU time, peak
+# RSS, the cutoffs it ran with and the hot-path counters it ran up
+def profile_end(stage, begin, cutoff_dict):
+	if profile_stage_list is None:
+		return
+	stage_record = dict()
+	stage_record['stage'] = stage
+	stage_record.update(cutoff_dict)
+	stage_record['wall_sec'] = round(time.time() - begin['wall'], 3)
+	stage_record['cpu_sec'] = round(cpu_time() - begin['cpu'], 3)
+	stage_record['peak_rss_mb'] = round(read_peak_rss(), 1)
+	if begin['rss_reset']:
+		stage_record['peak_rss_scope'] = 'stage'
+	else:
+		stage_record['peak_rss_scope'] = 'process'
+	counter_dict = dict(profile_counter_dict)
+	if 'worker_processes' in counter_dict:
+		stage_record['workers_peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+	if profile_expansion_list:
+		expansion_step = np.array(profile_expansion_list)
+		counter_dict['expansions'] = len(expansion_step)
+		counter_dict['expansion_iterations'] = int(expansion_step.sum())
+		counter_dict['expansion_iterations_mean'] = round(float(expansion_step.mean()), 3)
+		counter_dict['expansion_iterations_max'] = int(expansion_step.max())
+		for percentile in [50, 90, 99]:
+			counter_dict['expansion_iterations_p'+str(percentile)] = float(np.percentile(expansion_step, percentile))
+	stage_record['counters'] = counter_dict
+	profile_stage_list.append(stage_record)
+
+
+# function for the JSON profile report: the parameters of the run, a record
+# per stage and the totals since start_wall and start_cpu
+def write_profile(filename, parameter_dict, start_wall, start_cpu):
+	report = dict()
+	report['version'] = __version__
+	report['parameters'] = parameter_dict
+	report['stages'] = profile_stage_list
+	report['total'] = dict()
+	report['total']['wall_sec'] = round(time.time() - start_wall, 3)
+	report['total']['cpu_sec'] = round(cpu_time() - start_cpu, 3)
+	report['total']['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+	file_profile = open(filename, 'w')
+	json.dump(report, file_profile, indent=1)
+	file_profile.write('\n')
+	file_profile.close()
+
+
+# function for the seed cases of shard shard_i (1 to shard_n) as a (first,
+# last) block of the case list; the blocks follow each other so that the
+# shards read back in order give the initial clusters in seed case order
+def shard_range(case_count, shard_i, shard_n):
+	return case_count * (shard_i - 1) // shard_n, case_count * shard_i // shard_n
+
+
+# function for the clustering of one shard of the seed cases into
+# temp_clusters_shard_<i>_of_<n>.txt of output_dir, headed by the clustering
+# key so that the reduce step only takes shards of the same inputs and
+# parameters; a shard needs nothing but the input and reference files, and
+# only boost N can be sharded since boost Y carries the visited genes over
+# all seed cases
+def run_shard(references, cohort, output_dir, shard_i, shard_n, edge_cutoff=0.99, hub_cutoff=100, threads=1,
+			  resume='N', checkpoint_interval=600, topk=0, stop_edge=0):
+	clustering_key = checkpoint_keys(references, cohort, edge_cutoff, hub_cutoff, 0, 'N', 1, '', topk=topk,
+									 stop_edge=stop_edge)['clustering']
+	shard_name = 'shard_'+str(shard_i)+'_of_'+str(shard_n)
+	cutoff_dict = {'edge': edge_cutoff, 'hub': hub_cutoff, 'shard': shard_name}
+	begin = profile_begin()
+	case_network_dict = filter_network(references, cohort, edge_cutoff, hub_cutoff)
+	profile_end('network_filter', begin, cutoff_dict)
+	first_case, last_case = shard_range(len(cohort['case_list']), shard_i, shard_n)
+	print('>> Shard '+str(shard_i)+'/'+str(shard_n)+': seed cases '+str(first_case+1)+' to '+str(last_case)+'\n')
+	begin = profile_begin()
+	cluster_result_list = cluster_genes(cohort, case_network_dict, 'N', threads,
+										checkpoint_file=output_dir+'/temp_clusters_checkpoint_'+shard_name+'.txt',
+										checkpoint_key=text_checksum([clustering_key, shard_name]),
+										checkpoint_interval=checkpoint_interval, resume=resume,
+										case_range=(first_case, last_case), topk=topk, stop_edge=stop_edge)
+	profile_end('clustering', begin, cutoff_dict)
+
+	filename_shard = output_dir+'/temp_clusters_'+shard_name+'.txt'
+	file_shard = open(filename_shard + '.tmp', 'w')
+	file_shard.write('key\t' + clustering_key + '\n')
+	file_shard.write('shard\t' + str(shard_i) + '\t' + str(shard_n) + '\n')
+	for each_cluster in cluster_result_list:
+		file_shard.write(each_cluster + '\n')
+	file_shard.close()
+	os.replace(filename_shard + '.tmp', filename_shard)
+	if os.path.exists(output_dir+'/temp_clusters_checkpoint_'+shard_name+'.txt'):
+		os.remove(output_dir+'/temp_clusters_checkpoint_'+shard_name+'.txt')
+	print('>> Shard File: '+filename_shard+'\n')
+	return filename_shard
+
+
+# function for the reduce step over the shard files of output_dir: checks that
+# all shards are there and were clustered with the same inputs and parameters,
+# then removes duplicate clusters in shard order as the clustering does over
+# seed cases; returns the initial clusters and the shard files
+def read_shards(references, cohort, output_dir, edge_cutoff=0.99, hub_cutoff=100, topk=0, stop_edge=0):
+	clustering_key = checkpoint_keys(references, cohort, edge_cutoff, hub_cutoff, 0, 'N', 1, '', topk=topk,
+									 stop_edge=stop_edge)['clustering']
+	shard_dict = dict()
+	shard_n_set = set()
+	for filename in os.listdir(output_dir):
+		item = filename[:-len('.txt')].split('_')
+		if filename.startswith('temp_clusters_shard_') and filename.endswith('.txt') and len(item) == 6:
+			shard_dict[int(item[3])] = output_dir+'/'+filename
+			shard_n_set.add(int(item[5]))
+	if len(shard_n_set) != 1:
+		raise ValueError('expected the shard files of one -shard i/N split in '+output_dir+', found '+
+						 str(len(shard_n_set))+' splits')
+	shard_n = shard_n_set.pop()
+	missing_list = [str(shard_i) for shard_i in range(1, shard_n + 1) if shard_i not in shard_dict]
+	if missing_list:
+		raise ValueError('missing shards '+','.join(missing_list)+' of '+str(shard_n)+' in '+output_dir)
+
+	print('>> Reading Shards')
+	global_clusters = set()
+	global_cluster_result = list()
+	for shard_i in range(1, shard_n + 1):
+		line_list = read_lines(shard_dict[shard_i], 0)
+		if line_list[0] != 'key\t' + clustering_key:
+			raise ValueError(shard_dict[shard_i]+' was clustered with other inputs or parameters')
+		for each_cluster in line_list[2:]:
+			this_gene_cluster_output = each_cluster.split('\t')[1]
+			if this_gene_cluster_output not in global_clusters:
+				global_clusters.add(this_gene_cluster_output)
+				global_cluster_result.append(each_cluster)
+		print('   '+str(shard_i)+'/'+str(shard_n)+' '+shard_dict[shard_i])
+	print('   # Gene Clusters (initial): '+str(len(global_cluster_result))+'\n')
+	return global_cluster_result, [shard_dict[shard_i] for shard_i in range(1, shard_n + 1)]
+
+
+# function for the PYTHONHASHSEED of this process, None when its hash seed is
+# random; it decides the iteration order of the sets of genes and cases
+def hash_seed():
+	seed = os.environ.get('PYTHONHASHSEED')
+	if seed is None or seed == 'random':
+		return None
+	return seed
+
+
+# function for writing the seeds of a run to NHC_output_seeds.txt for a later
+# -update: the seed key (network, cutoffs), input checksum and hash seed, the
+# cluster lines once each, then for every seed its case, seed gene, the number
+# of its cluster line ('.' for clusters of two genes or less) and its cluster
+# genes in the order they were added
+def write_seed_file(output_dir, seed_key, input_checksum, seed_record_list):
+	result_id_dict = dict()
+	for case, cur_gene, this_gene_order_output, this_cluster_result in seed_record_list:
+		if this_cluster_result is not None and this_cluster_result not in result_id_dict:
+			result_id_dict[this_cluster_result] = len(result_id_dict)
+	filename_seed = output_dir+'/NHC_output_seeds.txt'
+	file_seed = open(filename_seed + '.tmp', 'w')
+	file_seed.write('key\t' + seed_key + '\n')
+	file_seed.write('input\t' + input_checksum + '\n')
+	file_seed.write('hash\t' + str(hash_seed()) + '\n')
+	file_seed.write('results\t' + str(len(result_id_dict)) + '\n')
+	for this_cluster_result in result_id_dict:
+		file_seed.write(this_cluster_result + '\n')
+	file_seed.write('seeds\t' + str(len(seed_record_list)) + '\n')
+	for case, cur_gene, this_gene_order_output, this_cluster_result in seed_record_list:
+		result_id = '.'
+		if this_cluster_result is not None:
+			result_id = str(result_id_dict[this_cluster_result])
+		file_seed.write(case + '\t' + cur_gene + '\t' + result_id + '\t' + this_gene_order_output + '\n')
+	file_seed.close()
+	os.replace(filename_seed + '.tmp', filename_seed)
+
+
+# function for reading NHC_output_seeds.txt of an earlier output folder,
+# returns its input checksum and case -> list of (seed gene, cluster genes in
+# the order they were added, cluster line or None) in seed order; raises
+# ValueError when the folder has no seed file, when it was written with
+# another network or cutoffs, or under another hash seed than this process,
+# as the seed order of the cases follows the iteration order of sets
+def read_seed_file(previous_dir, seed_key):
+	filename_seed = previous_dir+'/NHC_output_seeds.txt'
+	if not os.path.exists(filename_seed):
+		raise ValueError('no NHC_output_seeds.txt in '+previous_dir+', run it with -seeds Y first')
+	line_list = read_lines(filename_seed, 0)
+	if line_list[0] != 'key\t' + seed_key:
+		raise ValueError(filename_seed+' was written with another network, -edge or -hub')
+	if not line_list[2].startswith('hash\t'):
+		raise ValueError(filename_seed+' does not record its hash seed, run it again with -seeds Y')
+	if line_list[2] == 'hash\tNone' or hash_seed() is None:
+		raise ValueError(filename_seed+' and this run need the same fixed PYTHONHASHSEED, the hash seed of one of '
+						 'them is random')
+	if line_list[2] != 'hash\t' + hash_seed():
+		raise ValueError(filename_seed+' was written with PYTHONHASHSEED='+line_list[2].split('\t')[1]+
+						 ', this run has '+hash_seed())
+	result_count = int(line_list[3].split('\t')[1])
+	result_list = line_list[4:4+result_count]
+	previous_seed_dict = defaultdict(list)
+	for eachline in line_list[5+result_count:]:
+		item = eachline.split('\t')
+		this_cluster_result = None
+		if item[2] != '.':
+			this_cluster_result = result_list[int(item[2])]
+		previous_seed_dict[item[0]].append((item[1], item[3], this_cluster_result))
+	return line_list[1].split('\t')[1], previous_seed_dict
+
+
+# function for the seeds of an earlier run that -update can take over.
+# Cases added, removed, or whose genes changed or come in another seed order
+# are the changed cases. A seed expansion only notices a changed case once a
+# gene carried by the case, or next to one, joins the cluster. When that
+# first gene is carried by the case both before and after the change (or on
+# the side where the case exists, for added and removed cases), the case is
+# taken through the overlap before any further gene can join, so the cluster
+# genes stay the same and only the case is added to or dropped from its
+# cases. Any other contact and the seed is expanded again.
+# Returns case -> {seed gene: (cluster genes in order, cluster line or None)}
+def reusable_seeds(references, cohort, previous_seed_dict, edge_cutoff, hub_cutoff):
+	case_gene_set_dict = cohort['case_gene_set_dict']
+	changed_case_dict = dict()
+	unchanged_case_list = list()
+	for case in set(cohort['case_list']) | set(previous_seed_dict):
+		case_gene_list = list()
+		if case in case_gene_set_dict:
+			case_gene_list = list(case_gene_set_dict[case])
+		previous_gene_list = [each_seed[0] for each_seed in previous_seed_dict.get(case, [])]
+		if case_gene_list == previous_gene_list:
+			unchanged_case_list.append(case)
+		else:
+			changed_case_dict[case] = (set(previous_gene_list), set(case_gene_list))
+
+	# genes that bring a changed case in contact with a cluster: its genes
+	# before and after the change and their neighbors, among the genes of both
+	# cohorts so that the edges of genes carried only by removed cases count
+	changed_gene_set = set()
+	for previous_gene_set, case_gene_set in changed_case_dict.values():
+		changed_gene_set |= previous_gene_set | case_gene_set
+	neighbor_dict = defaultdict(set)
+	gene_universe_set = cohort['case_gene_set'] | changed_gene_set
+	for gene_pair in nhc_reference.case_network(references['network'], gene_universe_set, edge_cutoff, hub_cutoff):
+		if gene_pair[0] in changed_gene_set:
+			neighbor_dict[gene_pair[0]].add(gene_pair[1])
+		if gene_pair[1] in changed_gene_set:
+			neighbor_dict[gene_pair[1]].add(gene_pair[0])
+	contact_dict = defaultdict(list)
+	for case in sorted(changed_case_dict):
+		previous_gene_set, case_gene_set = changed_case_dict[case]
+		contact_gene_set = previous_gene_set | case_gene_set
+		for gene in previous_gene_set | case_gene_set:
+			contact_gene_set |= neighbor_dict[gene]
+		for gene in contact_gene_set:
+			contact_dict[gene].append(case)
+
+	reuse_seed_dict = dict()
+	for case in unchanged_case_list:
+		reuse_seed_dict[case] = dict()
+		for cur_gene, this_gene_order_output, this_cluster_result in previous_seed_dict[case]:
+			reusable = True
+			added_case_list = list()
+			removed_case_set = set()
+			contacted_case_set = set()
+			for gene in this_gene_order_output.split(';'):
+				for changed_case in contact_dict.get(gene, []):
+					if changed_case in contacted_case_set:
+						continue
+					contacted_case_set.add(changed_case)
+					previous_gene_set, case_gene_set = changed_case_dict[changed_case]
+					if previous_gene_set and gene not in previous_gene_set:
+						reusable = False
+					elif case_gene_set and gene not in case_gene_set:
+						reusable = False
+					elif not previous_gene_set:
+						added_case_list.append(changed_case)
+					elif not case_gene_set:
+						removed_case_set.add(changed_case)
+				if not reusable:
+					break
+			if not reusable:
+				continue
+			if this_cluster_result is not None and (added_case_list or removed_case_set):
+				item = this_cluster_result.split('\t')
+				this_case_cluster_list = [each_case for each_case in item[3].split(';') if each_case not in removed_case_set]
+				this_case_cluster_list += added_case_list
+				this_case_cluster_list.sort()
+				this_cluster_result = (item[0]+'\t'+item[1]+'\t'+str(len(this_case_cluster_list))+'\t'+
+									   ';'.join(this_case_cluster_list))
+			reuse_seed_dict[case][cur_gene] = (this_gene_order_output, this_cluster_result)
+	return reuse_seed_dict
+
+
+# function for one NHC run into output_dir; the filtered network and the
+# initial clusters are computed unless given, so that runs differing only in
+# the merge cutoff can share them. The output of each stage is recorded in
+# temp_checkpoint.txt under a key of the inputs and parameters, and with
+# resume Y the stages whose outputs are still valid are read back instead of
+# being run again, the clustering continuing from its last checkpoint.
+# Returns the cluster counts of the run and its initial clusters.
+def run_nhc(references, cohort, output_dir, mode=1, edge_cutoff=0.99, hub_cutoff=100, merge_cutoff=0.5,
+			boost='N', network='N', glm='native', threads=1, case_network_dict=None, cluster_result_list=None,
+			resume='N', checkpoint_interval=600, seeds='N', reuse_seed_dict=None, export='files', permutations=0,
+			topk=0, stop_edge=0, approx_report=0):
+	key_dict = checkpoint_keys(references, cohort, edge_cutoff, hub_cutoff, merge_cutoff, boost, mode, glm,
+							   permutations, topk, stop_edge)
+	stage_key_dict = dict()
+	if resume == 'Y':
+		stage_key_dict = read_stage_checkpoint(output_dir)
+	else:
+		open(output_dir+'/temp_checkpoint.txt', 'w').close()
+	# function for whether the output of a stage can be read back
+	def stage_valid(stage, filename):
+		return stage_key_dict.get(stage) == key_dict[stage] and os.path.exists(output_dir+'/'+filename)
+
+	cutoff_dict = {'edge': edge_cutoff, 'hub': hub_cutoff, 'merge': merge_cutoff}
+	if case_network_dict is None:
+		begin = profile_begin()
+		case_network_dict = filter_network(references, cohort, edge_cutoff, hub_cutoff)
+		profile_end('network_filter', begin, cutoff_dict)
+	begin = profile_begin()
+	clustered = False
+	if cluster_result_list is not None:
+		print('>> Gene Clustering')
+		print('   # Gene Clusters (initial): '+str(len(cluster_result_list))+', reused\n')
+	elif stage_valid('clustering', 'temp_clusters_initial.txt'):
+		cluster_result_list = read_lines(output_dir+'/temp_clusters_initial.txt', 0)
+		print('>> Gene Clustering')
+		print('   # Gene Clusters (initial): '+str(len(cluster_result_list))+', resumed\n')
+	else:
+		seed_record_list = None
+		if seeds == 'Y':
+			seed_record_list = list()
+		cluster_result_list = cluster_genes(cohort, case_network_dict, boost, threads,
+											checkpoint_file=output_dir+'/temp_clusters_checkpoint.txt',
+											checkpoint_key=key_dict['clustering'],
+											checkpoint_interval=checkpoint_interval, resume=resume,
+											reuse_seed_dict=reuse_seed_dict, seed_record_list=seed_record_list,
+											topk=topk, stop_edge=stop_edge)
+		clustered = True
+		if seed_record_list is not None:
+			seed_count = sum(len(cohort['case_gene_set_dict'][case]) for case in cohort['case_list'])
+			if len(seed_record_list) == seed_count:
+				write_seed_file(output_dir, key_dict['seeds'], cohort['input_checksum'], seed_record_list)
+			else:
+				print('   No NHC_output_seeds.txt, the clustering resumed from a checkpoint\n')
+	if not stage_valid('clustering', 'temp_clusters_initial.txt'):
+		file_out_initial = open(output_dir+'/temp_clusters_initial.txt', 'w')
+		for each_cluster in cluster_result_list:
+			file_out_initial.write(each_cluster + '\n')
+		file_out_initial.close()
+		write_stage_checkpoint(output_dir, 'clustering', key_dict['clustering'])
+	if os.path.exists(output_dir+'/temp_clusters_checkpoint.txt'):
+		os.remove(output_dir+'/temp_clusters_checkpoint.txt')
+	profile_end('clustering', begin, cutoff_dict)
+	if approx_report > 0 and clustered:
+		begin = profile_begin()
+		approximation_report(cohort, case_network_dict, topk, stop_edge, approx_report,
+							 output_dir+'/NHC_output_approximation_report.txt')
+		profile_end('approximation_report', begin, cutoff_dict)
+
+	begin = profile_begin()
+	if stage_valid('merging', 'temp_clusters_merged.txt'):
+		merged_line_list = read_lines(output_dir+'/temp_clusters_merged.txt', 0)
+		print('>> Gene Cluster Merging')
+		print('   # Gene Clusters (merged): '+str(len(merged_line_list))+', resumed\n')
+	else:
+		merged_line_list = merge_clusters(cluster_result_list, merge_cutoff)
+		file_out_merged = open(output_dir+'/temp_clusters_merged.txt', 'w')
+		for each_cluster in merged_line_list:
+			file_out_merged.write(each_cluster + '\n')
+		file_out_merged.close()
+		write_stage_checkpoint(output_dir, 'merging', key_dict['merging'])
+	profile_end('merging', begin, cutoff_dict)
+
+	begin = profile_begin()
+	if stage_valid('enrichment', 'NHC_output_gene_clusters.txt'):
+		cluster_output_list = read_lines(output_dir+'/NHC_output_gene_clusters.txt', 1)
+		enriched_count = 0
+		for eachline in cluster_output_list:
+			if eachline.split('\t')[6:6+len(database_list)] != ['.'] * len(database_list):
+				enriched_count += 1
+		print('>> Gene Cluster Enrichment')
+		print('   # Gene Clusters (enriched): '+'\t'+str(enriched_count)+', resumed\n')
+	else:
+		cluster_output_list, enriched_count = enrich_clusters(references, cohort, merged_line_list, mode, glm,
+															  threads, permutations)
+		file_output = open(output_dir+'/NHC_output_gene_clusters.txt', 'w')
+		if mode == 2 and permutations > 0:
+			file_output.write(cluster_output_header[0:-1]+'\t'+cluster_permutation_header+'\n')
+		else:
+			file_output.write(cluster_output_header)
+		for eachline in cluster_output_list:
+			file_output.write(eachline + '\n')
+		file_output.close()
+		write_stage_checkpoint(output_dir, 'enrichment', key_dict['enrichment'])
+	profile_end('enrichment', begin, cutoff_dict)
+
+	begin = profile_begin()
+	export_variants(cohort, cluster_output_list, output_dir, export)
+	profile_end('variant_export', begin, cutoff_dict)
+	if network == 'Y':
+		begin = profile_begin()
+		export_network(case_network_dict, cohort, cluster_output_list, output_dir, export)
+		profile_end('network_export', begin, cutoff_dict)
+
+	os.remove(output_dir+'/temp_clusters_initial.txt')
+	os.remove(output_dir+'/temp_clusters_merged.txt')
+	os.remove(output_dir+'/temp_checkpoint.txt')
+	summary = dict()
+	summary['initial'] = len(cluster_result_list)
+	summary['merged'] = len(merged_line_list)
+	summary['enriched'] = enriched_count
+	summary['cluster_result_list'] = cluster_result_list
+	return summary
+
+
+# function for a grid of cutoffs on references and a cohort loaded once: each
+# edge/hub pair filters the parsed network and clusters once, and every merge
+# cutoff of the pair reuses those initial clusters. output_dir_function gives
+# the output folder of (edge, hub, merge) and parameter_function the lines of
+# its NHC_input_parameters.txt. Returns (edge, hub, merge, output_dir, summary)
+# for every point of the grid.
+def run_sweep(references, cohort, edge_list, hub_list, merge_list, output_dir_function, parameter_function,
+			  mode=1, boost='N', network='N', glm='native', threads=1, resume='N', checkpoint_interval=600,
+			  seeds='N', reuse_seed_dict=None, export='files', permutations=0, topk=0, stop_edge=0, approx_report=0):
+	sweep_result_list = list()
+	for edge_cutoff in edge_list:
+		for hub_cutoff in hub_list:
+			begin = profile_begin()
+			case_network_dict = filter_network(references, cohort, edge_cutoff, hub_cutoff)
+			profile_end('network_filter', begin, {'edge': edge_cutoff, 'hub': hub_cutoff})
+			cluster_result_list = None
+			for merge_cutoff in merge_list:
+				output_dir = output_dir_function(edge_cutoff, hub_cutoff, merge_cutoff)
+				os.system('mkdir -p '+output_dir)
+				write_parameters(output_dir, parameter_function(edge_cutoff, hub_cutoff, merge_cutoff))
+				if len(edge_list) * len(hub_list) * len(merge_list) > 1:
+					print('>> Cutoffs: edge '+str(edge_cutoff)+', hub '+str(hub_cutoff)+', merge '+str(merge_cutoff)+'\n')
+				summary = run_nhc(references, cohort, output_dir, mode=mode, edge_cutoff=edge_cutoff,
+								  hub_cutoff=hub_cutoff, merge_cutoff=merge_cutoff, boost=boost, network=network,
+								  glm=glm, threads=threads, case_network_dict=case_network_dict,
+								  cluster_result_list=cluster_result_list, resume=resume,
+								  checkpoint_interval=checkpoint_interval, seeds=seeds, reuse_seed_dict=reuse_seed_dict,
+								  export=export, permutations=permutations, topk=topk, stop_edge=stop_edge,
+								  approx_report=approx_report)
+				cluster_result_list = summary['cluster_result_list']
+				sweep_result_list.append((edge_cutoff, hub_cutoff, merge_cutoff, output_dir, summary))
+	return sweep_result_list
+
+
+# function for the command line parser of NHC.py
+def argument_parser():
+	parser = argparse.ArgumentParser(description="Network-based Heterogenity Clustering")
+	parser.add_argument("-path", help="absolute path of the input files")
+	parser.add_argument("-input", help="input file for samples, genes and variants [check test_input.txt]")
+	parser.add_argument("-pc", help="three principal components for all samples [check test_pc.txt]")
+	parser.add_argument("-mode", type=int, default=1, help="(default=1), 1 for case-only analysis; 2 for case-vs-control analysis")
+	parser.add_argument("-edge", type=float, default=0.99, help="(default=0.99), edge weight cutoff, range: 0.7~1")
+	parser.add_argument("-hub", type=int, default=100, help="(default=100), remove hub genes with high connectivity, use 0 to keep all genes")
+	parser.add_argument("-merge", type=float, default=0.5, help="(default=0.5), merge overlapped gene clusters, range: 0~1")
+	parser.add_argument("-boost", type=str, default='N', help="(default=N), Y or N to use boost version")
+	parser.add_argument("-network", type=str, default='N', help="(default=N), Y or N to generate network files for visualization")
+	parser.add_argument("-export", type=str, default='files', help="(default=files), files for a variant file (and network and node files) per cluster; table or table.gz for single NHC_output_variants.txt (and NHC_output_network.txt, NHC_output_nodes.txt) tables keyed by cluster, table.gz gzip-compressed")
+	parser.add_argument("-glm", type=str, default='native', help="(default=native), native or R for the logistic regression in mode 2, R runs glm through rpy2")
+	parser.add_argument("-permutations", type=int, default=0, help="(default=0), number of case/control label permutations in mode 2 for the empirical and family-wise (max-T) p-values of each cluster, written as two more columns of the cluster table; they test the standardized count of carrier cases and, unlike the glm p-value of Cluster_pvalue, are not adjusted for the PCs; 0 for none")
+	parser.add_argument("-topk", type=int, default=0, help="(default=0), approximate mode: keep only the k strongest edges of each gene above -edge, so that each step only looks at the cases reachable through them; 0 for the exact search")
+	parser.add_argument("-stop_edge", type=float, default=0, help="(default=0), approximate mode: stop an expansion once its strongest edge to a remaining case is below this bound; 0 for never")
+	parser.add_argument("-approx_report", type=int, default=0, help="(default=0), number of seeds sampled to compare the approximate mode with the exact search (gene and case Jaccard, time) in NHC_output_approximation_report.txt; 0 for none")
+	parser.add_argument("-threads", type=int, default=1, help="(default=1), number of processes for gene clustering, used when boost is N, and for the enrichment, native glm and permutations of the merged clusters")
+	parser.add_argument("-sweep", type=str, default=None, help="(default=None), grid of cutoffs evaluated in one run, e.g. edge=0.95,0.99:hub=0,100:merge=0.3,0.5; cutoffs left out keep their single value, one output folder per combination")
+	parser.add_argument("-resume", type=str, default='N', help="(default=N), Y or N to resume an interrupted run in the same output folder, finished seed cases and stages with valid outputs are not run again")
+	parser.add_argument("-checkpoint", type=int, default=600, help="(default=600), seconds between checkpoints of the gene clustering, use 0 to disable")
+	parser.add_argument("-profile", type=str, default='N', help="(default=N), Y or N to write a JSON report of the time, CPU, peak memory and hot-path counters of each stage")
+	parser.add_argument("-shard", type=str, default=None, help="(default=None), i/N to cluster only the i-th of N blocks of seed cases (i from 1 to N) into a shard file of the output folder, boost N only")
+	parser.add_argument("-reduce", type=str, default='N', help="(default=N), Y or N to combine the shard files of the output folder and run merging, enrichment and export")
+	parser.add_argument("-seeds", type=str, default='N', help="(default=N), Y or N to keep the cluster of every seed in NHC_output_seeds.txt of the output folder, needed by a later -update, boost N only; the later run must have the same PYTHONHASHSEED, set to 0 when not given")
+	parser.add_argument("-update", type=str, default=None, help="(default=None), output folder of an earlier run with -seeds Y on part of the cohort; only the seeds that the added, removed or changed cases can reach are expanded again, boost N only; needs the PYTHONHASHSEED of the earlier run, set to 0 when not given")
+	parser.add_argument("-cache", type=str, default=None, help="(default=None), folder of an enrichment cache shared by runs, clusters with the same genes and gene-set file are not tested again")
+	parser.add_argument("-cache_size", type=int, default=100, help="(default=100), size limit of the enrichment cache in MB, least recently used clusters are removed first")
+	parser.add_argument("-suffix", help="suffix of output folder")
+	parser.add_argument("-data", help="Absolute path to data folder contain reference files for NHC.")
+	parser.add_argument("-serve", type=str, default=None, help="(default=None), path of a Unix socket to serve NHC jobs on, keeping the references of -data loaded; jobs are sent with nhc-client")
+	parser.add_argument("-workers", type=int, default=2, help="(default=2), number of jobs the -serve daemon runs at the same time")
+
+	return parser
+
+
+# function for running NHC from its parsed command line, with the references
+# of the data folder loaded here or, for a job of the -serve daemon, already
+# resident
+def run_job(parser, args, references=None):
+	print('\n---------------------------------------')
+	print('   ###    ##   ##     ##     ######    ')
+	print('   ## #   ##   ##     ##    ##    ##   ')
+	print('   ##  #  ##   #########   ##          ')
+	print('   ##   # ##   ##     ##    ##    ##   ')
+	print('   ##    ###   ##     ##     ######    \n')
+	print(' Network-based Heterogenity Clustering ')
+	print('---------------------------------------\n')
+
+	global_start = time.time()
+	path = args.path
+	filename_input = args.input
+	filename_pc = args.pc
+	mode = args.mode
+	boost = args.boost
+	network = args.network
+	export = args.export
+	permutations = args.permutations
+	topk = args.topk
+	stop_edge = args.stop_edge
+	approx_report = args.approx_report
+	glm = args.glm
+	threads = args.threads
+	sweep = args.sweep
+	resume = args.resume
+	checkpoint_interval = args.checkpoint
+	profile = args.profile
+	shard = args.shard
+	reduce = args.reduce
+	seeds = args.seeds
+	update = args.update
+	suffix = args.suffix
+	# This is the directory to the data folder
+	# containing the reference files for NHC
+	# such as the Data_NHC_Network_Connectivity.txt
+	# Data_NHC_Network.txt, Data_NHC_Geneset.txt
+	# etc.
+	data = os.path.abspath(args.data)
+	try:
+		edge_list, hub_list, merge_list = sweep_grid(sweep, args.edge, args.hub, args.merge)
+	except ValueError as error:
+		parser.error(str(error))
+	if permutations < 0 or (permutations > 0 and mode != 2):
+		parser.error('-permutations needs -mode 2 and a number of permutations of at least 0')
+	if topk < 0 or stop_edge < 0 or approx_report < 0:
+		parser.error('-topk, -stop_edge and -approx_report expect values of at least 0')
+	if approx_report > 0 and topk == 0 and stop_edge == 0:
+		parser.error('-approx_report compares the approximate mode of -topk or -stop_edge with the exact search')
+	if boost not in ['N', 'Y']:
+		parser.error('-boost expects Y or N, got ' + boost)
+	if glm not in ['native', 'R']:
+		parser.error('-glm expects native or R, got ' + glm)
+	if export not in ['files', 'table', 'table.gz']:
+		parser.error('-export expects files, table or table.gz, got ' + export)
+	if shard is not None or reduce == 'Y':
+		if boost != 'N' or sweep is not None:
+			parser.error('-shard and -reduce run with -boost N and without -sweep')
+	if shard is not None:
+		item = shard.split('/')
+		if len(item) != 2 or not item[0].isdigit() or not item[1].isdigit() or not 1 <= int(item[0]) <= int(item[1]):
+			parser.error('-shard expects i/N with i from 1 to N, got ' + shard)
+		shard_i = int(item[0])
+		shard_n = int(item[1])
+	if update is not None:
+		seeds = 'Y'
+	if seeds == 'Y':
+		if boost != 'N' or sweep is not None or shard is not None or reduce == 'Y':
+			parser.error('-seeds and -update run with -boost N and without -sweep, -shard or -reduce')
+	if update is not None and (topk > 0 or stop_edge > 0):
+		parser.error('-update reuses the seeds of the exact search, without -topk or -stop_edge')
+	if approx_report > 0 and (shard is not None or reduce == 'Y'):
+		parser.error('-approx_report runs without -shard or -reduce')
+
+	if path[-1] != '/':
+		path = path + '/'
+
+	# function for the output folder of a set of cutoffs, suffixed with the
+	# cutoffs when sweeping
+	def output_dir_function(edge_cutoff, hub_cutoff, merge_cutoff):
+		output_folder = 'NHC_output'+'_'+suffix
+		if sweep is not None:
+			output_folder += '_edge'+str(edge_cutoff)+'_hub'+str(hub_cutoff)+'_merge'+str(merge_cutoff)
+		return path+output_folder
+
+	# function for the parameters file of a set of cutoffs
+	def parameter_function(edge_cutoff, hub_cutoff, merge_cutoff):
+		parameter_list = [('Path', path), ('Input', filename_input), ('PC', filename_pc), ('Mode', mode),
+						  ('Edge-Weight Cutoff', edge_cutoff), ('Hub-Gene Cutoff', hub_cutoff),
+						  ('Cluster-Merge Cutoff', merge_cutoff), ('Boost', boost), ('Network', network),
+						  ('GLM', glm), ('Threads', threads), ('Resume', resume), ('Checkpoint', checkpoint_interval),
+						  ('Profile', profile)]
+		if sweep is not None:
+			parameter_list.append(('Sweep', sweep))
+		if reduce == 'Y':
+			parameter_list.append(('Reduce', reduce))
+		if seeds == 'Y':
+			parameter_list.append(('Seeds', seeds))
+		if update is not None:
+			parameter_list.append(('Update', update))
+		if args.cache is not None:
+			parameter_list.append(('Cache', args.cache))
+		if export != 'files':
+			parameter_list.append(('Export', export))
+		if permutations > 0:
+			parameter_list.append(('Permutations', permutations))
+		if topk > 0 or stop_edge > 0:
+			parameter_list.append(('Top-k Edges', topk))
+			parameter_list.append(('Stop Edge', stop_edge))
+		if approx_report > 0:
+			parameter_list.append(('Approximation Report', approx_report))
+		parameter_list.append(('Suffix', suffix))
+		parameter_list.append(('Output', output_dir_function(edge_cutoff, hub_cutoff, merge_cutoff)))
+		return parameter_list
+
+	global_start_cpu = cpu_time()
+	if profile == 'Y':
+		profile_start()
+	if args.cache is not None:
+		cache_start(os.path.abspath(args.cache), args.cache_size)
+	print('>> Loading Data\n')
+	begin = profile_begin()
+	# without a bundle, parsing the whole network only pays off for the runs
+	# that filter it more than once
+	if references is None and (sweep is not None or update is not None):
+		references = load_references(data)
+	elif references is None:
+		references = load_references(data, parse='N')
+	cohort = load_cohort(path + filename_input, filename_pc)
+	profile_end('loading', begin, {})
+
+	output_dir = output_dir_function(args.edge, args.hub, args.merge)
+	if shard is not None:
+		os.system('mkdir -p '+output_dir)
+		run_shard(references, cohort, output_dir, shard_i, shard_n, edge_cutoff=args.edge, hub_cutoff=args.hub,
+				  threads=threads, resume=resume, checkpoint_interval=checkpoint_interval, topk=topk, stop_edge=stop_edge)
+	elif reduce == 'Y':
+		try:
+			cluster_result_list, shard_file_list = read_shards(references, cohort, output_dir, edge_cutoff=args.edge,
+															   hub_cutoff=args.hub, topk=topk, stop_edge=stop_edge)
+		except (OSError, ValueError) as error:
+			parser.error(str(error))
+		write_parameters(output_dir, parameter_function(args.edge, args.hub, args.merge))
+		run_nhc(references, cohort, output_dir, mode=mode, edge_cutoff=args.edge, hub_cutoff=args.hub,
+				merge_cutoff=args.merge, network=network, glm=glm, threads=threads,
+				cluster_result_list=cluster_result_list, resume=resume, export=export, permutations=permutations)
+		for filename_shard in shard_file_list:
+			os.remove(filename_shard)
+	else:
+		reuse_seed_dict = None
+		if update is not None:
+			begin = profile_begin()
+			seed_key = checkpoint_keys(references, cohort, args.edge, args.hub, 0, 'N', 1, '', topk=topk,
+									   stop_edge=stop_edge)['seeds']
+			try:
+				previous_input_checksum, previous_seed_dict = read_seed_file(os.path.abspath(update), seed_key)
+			except (OSError, ValueError) as error:
+				parser.error(str(error))
+			reuse_seed_dict = reusable_seeds(references, cohort, previous_seed_dict, args.edge, args.hub)
+			reuse_count = sum(len(reuse_seed_dict[case]) for case in reuse_seed_dict)
+			seed_count = sum(len(cohort['case_gene_set_dict'][case]) for case in cohort['case_list'])
+			print('>> Updating '+os.path.abspath(update))
+			if previous_input_checksum == cohort['input_checksum']:
+				print('   The input file is the same as in the earlier run')
+			print('   # Seeds reused: '+str(reuse_count)+'/'+str(seed_count)+'\n')
+			profile_end('update', begin, {'edge': args.edge, 'hub': args.hub})
+		sweep_result_list = run_sweep(references, cohort, edge_list, hub_list, merge_list, output_dir_function,
+									  parameter_function, mode=mode, boost=boost, network=network, glm=glm,
+									  threads=threads, resume=resume, checkpoint_interval=checkpoint_interval,
+									  seeds=seeds, reuse_seed_dict=reuse_seed_dict, export=export,
+									  permutations=permutations, topk=topk, stop_edge=stop_edge,
+									  approx_report=approx_report)
+
+	if sweep is not None:
+		file_sweep = open(path+'NHC_output_'+suffix+'_sweep.txt', 'w')
+		file_sweep.write('Edge\tHub\tMerge\tClusters_Initial\tClusters_Merged\tClusters_Enriched\tOutput\n')
+		for edge_cutoff, hub_cutoff, merge_cutoff, output_dir, summary in sweep_result_list:
+			file_sweep.write(str(edge_cutoff)+'\t'+str(hub_cutoff)+'\t'+str(merge_cutoff)+'\t'+
+							 str(summary['initial'])+'\t'+str(summary['merged'])+'\t'+
+							 str(summary['enriched'])+'\t'+output_dir+'\n')
+		file_sweep.close()
+		print('>> Sweep Summary: '+path+'NHC_output_'+suffix+'_sweep.txt\n')
+
+	if profile == 'Y':
+		if shard is not None:
+			filename_profile = output_dir+'/NHC_profile_shard_'+str(shard_i)+'_of_'+str(shard_n)+'.json'
+		elif sweep is None:
+			filename_profile = output_dir+'/NHC_profile.json'
+		else:
+			filename_profile = path+'NHC_output_'+suffix+'_profile.json'
+		write_profile(filename_profile, vars(args), global_start, global_start_cpu)
+		print('>> Profile: '+filename_profile+'\n')
+
+	if enrichment_cache is not None:
+		print('>> Enrichment Cache: '+str(enrichment_cache['hits'])+' hits, '+str(enrichment_cache['misses'])+
+			  ' misses, '+str(enrichment_cache['evicted'])+' evicted\n')
+
+	global_end = time.time()
+	global_timecost = str(round(global_end-global_start, 3))
+	print('>> Total Time Cost:'+'\t'+global_timecost+' sec\n')
+
+
+
+###
+# (9) Serving NHC Jobs
+###
+
+# function for one job of the -serve daemon, run in the forked worker process:
+# the request is a JSON line with the arguments and the working directory of
+# nhc-client, the output of the job goes back over the connection, followed by
+# a NUL byte and the exit status of the job
+def serve_job(conn, parser, references, data):
+	request = json.loads(conn.makefile('r').readline())
+	os.dup2(conn.fileno(), 1)
+	os.dup2(conn.fileno(), 2)
+	sys.stdout.reconfigure(line_buffering=True)
+	status = 0
+	try:
+		os.chdir(request['cwd'])
+		args = parser.parse_args(request['argv'])
+		if args.serve is not None:
+			parser.error('-serve cannot be sent to a daemon')
+		if args.data is not None and os.path.abspath(args.data) != data:
+			parser.error('the daemon serves -data '+data+', got '+os.path.abspath(args.data))
+		args.data = data
+		if reference_fingerprints(data) != (references['network_fingerprint'], references['geneset_fingerprint']):
+			print('   The reference files of '+data+' changed, loading them again for this job\n')
+			references = None
+		run_job(parser, args, references)
+	except SystemExit as error:
+		status = error.code if isinstance(error.code, int) else int(error.code is not None)
+	except KeyboardInterrupt:
+		status = 128 + signal.SIGINT
+	except Exception:
+		traceback.print_exc()
+		status = 1
+	sys.stdout.flush()
+	sys.stderr.flush()
+	conn.sendall(b'\0' + str(status).encode())
+	conn.close()
+	return status
+
+
+# function for SIGTERM in a job of the -serve daemon: the job ends with the
+# status of a process killed by the signal, which serve_job sends back, so that
+# an interrupted job is not reported as done
+def serve_job_interrupted(signum, frame):
+	sys.exit(128 + signum)
+
+
+# function for the daemon of -serve: the references of -data are loaded once,
+# with the gene-set matrices and, for -glm R, R itself, and every job received
+# on the Unix socket runs in a process forked from the daemon, which inherits
+# them; at most -workers jobs run at the same time, further clients wait in
+# the queue of the socket
+def serve(parser, args):
+	if args.data is None:
+		parser.error('-serve needs -data')
+	if args.workers < 1:
+		parser.error('-workers must be at least 1')
+	data = os.path.abspath(args.data)
+	socket_path = os.path.abspath(args.serve)
+	if os.path.exists(socket_path):
+		probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			probe.connect(socket_path)
+			parser.error('a daemon is already serving on '+socket_path)
+		except OSError:
+			os.remove(socket_path)
+		finally:
+			probe.close()
+
+	print('>> Loading Data\n')
+	references = load_references(data)
+	geneset_matrices(references)
+	if args.glm == 'R':
+		import rpy2.robjects
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	server.bind(socket_path)
+	server.listen(64)
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	print('>> Serving '+data+' on '+socket_path+' with '+str(args.workers)+' workers\n')
+
+	worker_set = set()
+	try:
+		while True:
+			conn, address = server.accept()
+			# finished jobs are collected when the next one comes in
+			while worker_set:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+				if pid == 0:
+					break
+				worker_set.discard(pid)
+			while len(worker_set) >= args.workers:
+				pid, status = os.wait()
+				worker_set.discard(pid)
+			sys.stdout.flush()
+			sys.stderr.flush()
+			pid = os.fork()
+			if pid == 0:
+				status = 1
+				try:
+					signal.signal(signal.SIGTERM, serve_job_interrupted)
+					server.close()
+					status = serve_job(conn, parser, references, data)
+				finally:
+					os._exit(status)
+			conn.close()
+			worker_set.add(pid)
+			print('   Job '+str(pid)+' started at '+time.strftime('%Y-%m-%d %H:%M:%S'))
+	finally:
+		server.close()
+		if os.path.exists(socket_path):
+			os.remove(socket_path)
+
+
+def main():
+	parser = argument_parser()
+	args = parser.parse_args()
+	# the seeds of -seeds and -update only match across runs under the same
+	# hash seed, so a run without one starts again with PYTHONHASHSEED=0
+	if args.serve is None and (args.seeds == 'Y' or args.update is not None) and hash_seed() is None:
+		print('   -seeds and -update need a fixed hash seed, running with PYTHONHASHSEED=0\n')
+		sys.stdout.flush()
+		os.execve(sys.executable, [sys.executable] + sys.argv, dict(os.environ, PYTHONHASHSEED='0'))
+	if args.serve is not None:
+		serve(parser, args)
+	else:
+		run_job(parser, args)
+
 
-os.remove(path+output_folder+'/temp_clusters_initial.txt')
-os.remove(path+output_folder+'/temp_clusters_merged.txt')
-if mode == 2:
-	os.remove('temp_pc.txt')
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Scaling benchmark for NHC.py on synthetic cohorts.
+#
+# Writes one synthetic reference folder and a cohort for every size of the
+# ladder (see synthetic_cohort.py), runs NHC.py -profile Y on each of them for
+# every -boost setting and collects the wall time, CPU time and peak RSS of
+# each stage from the profile reports. Prints the table and the scaling
+# exponent of each stage (slope of log time over log cases), and writes both
+# to scaling.tsv in the output folder.
+#
+# With -baseline, the times are compared to the scaling.tsv of an earlier run
+# and the benchmark exits with status 1 when a stage got slower than
+# -tolerance times its baseline, so that it can guard the performance of
+# gene_clustering and the merge loop.
+#
+# Usage: python scaling.py [-ladder 100,200,400,800] [-boost N,Y] [-mode 1]
+#        [-out <folder>] [-baseline <scaling.tsv>] [-tolerance 1.5]
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import synthetic_cohort
+
+nhc = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'NHC.py')
+stage_list = ['loading', 'network_filter', 'clustering', 'merging', 'enrichment', 'variant_export', 'network_export']
+# stages faster than this in the baseline are too noisy to flag
+regression_floor_sec = 0.5
+
+
+# function for the stage records of one NHC run, from its profile report
+def run_nhc(folder, suffix, boost, mode, threads, extra_list):
+	command = [sys.executable, nhc, '-path', folder, '-input', 'input.txt', '-pc', os.path.join(folder, 'pc.txt'),
+			   '-data', os.path.join(folder, os.pardir, 'data'), '-mode', str(mode), '-boost', boost,
+			   '-threads', str(threads), '-profile', 'Y', '-suffix', suffix] + extra_list
+	result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	if result.returncode != 0:
+		print(result.stderr[-2000:])
+		sys.exit(result.returncode)
+	file_profile = open(os.path.join(folder, 'NHC_output_' + suffix, 'NHC_profile.json'), 'r')
+	report = json.load(file_profile)
+	file_profile.close()
+	shutil.rmtree(os.path.join(folder, 'NHC_output_' + suffix))
+	return report['stages']
+
+
+# function for the scaling exponent of each (boost, stage), the least-squares
+# slope of log wall time over log number of cases
+def scaling_exponent(row_list):
+	exponent_dict = dict()
+	for boost in sorted(set(row[1] for row in row_list)):
+		for stage in stage_list:
+			point_list = [(row[0], row[3]) for row in row_list if row[1] == boost and row[2] == stage and row[3] > 0]
+			if len(point_list) >= 2:
+				x = np.log([point[0] for point in point_list])
+				y = np.log([point[1] for point in point_list])
+				exponent_dict[(boost, stage)] = round(float(np.polyfit(x, y, 1)[0]), 2)
+	return exponent_dict
+
+
+# function for the stages slower than tolerance times the baseline, returns a
+# list of (cases, boost, stage, baseline wall, wall)
+def regression_list(row_list, baseline, tolerance):
+	baseline_dict = dict()
+	file_baseline = open(baseline, 'r')
+	file_baseline.readline()
+	for eachline in file_baseline:
+		item = eachline.strip().split('\t')
+		if len(item) >= 4 and item[0].isdigit():
+			baseline_dict[(int(item[0]), item[1], item[2])] = float(item[3])
+	file_baseline.close()
+	slower_list = list()
+	for row in row_list:
+		baseline_wall = baseline_dict.get((row[0], row[1], row[2]))
+		if baseline_wall is not None and baseline_wall >= regression_floor_sec and row[3] > baseline_wall * tolerance:
+			slower_list.append((row[0], row[1], row[2], baseline_wall, row[3]))
+	return slower_list
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Scaling benchmark for NHC.py on synthetic cohorts")
+	parser.add_argument("-ladder", type=str, default='100,200,400,800', help="(default=100,200,400,800), numbers of cases of the size ladder")
+	parser.add_argument("-control_ratio", type=float, default=1.0, help="(default=1.0), controls per case")
+	parser.add_argument("-genes", type=int, default=5000, help="(default=5000), number of genes in the network")
+	parser.add_argument("-genes_per_case", type=int, default=20, help="(default=20), random genes carried by each sample")
+	parser.add_argument("-density", type=int, default=20, help="(default=20), average number of edges per gene")
+	parser.add_argument("-terms", type=int, default=200, help="(default=200), number of terms per gene-set database")
+	parser.add_argument("-boost", type=str, default='N,Y', help="(default=N,Y), -boost settings to run")
+	parser.add_argument("-mode", type=int, default=1, help="(default=1), -mode of the runs")
+	parser.add_argument("-threads", type=int, default=1, help="(default=1), -threads of the runs")
+	parser.add_argument("-nhc_args", type=str, default='', help="(default=''), further arguments for NHC.py, e.g. '-edge 0.99 -hub 100'")
+	parser.add_argument("-seed", type=int, default=1, help="(default=1), random seed of the synthetic data")
+	parser.add_argument("-out", type=str, default=None, help="(default=temporary folder), folder for the synthetic data and scaling.tsv")
+	parser.add_argument("-baseline", type=str, default=None, help="(default=None), scaling.tsv of an earlier run to compare against")
+	parser.add_argument("-tolerance", type=float, default=1.5, help="(default=1.5), slowdown over the baseline flagged as a regression")
+	args = parser.parse_args()
+
+	ladder = [int(value) for value in args.ladder.split(',')]
+	boost_list = args.boost.split(',')
+	folder = args.out
+	if folder is None:
+		folder = tempfile.mkdtemp(prefix='nhc_scaling_')
+	folder = os.path.abspath(folder)
+	gene_list, module_list = synthetic_cohort.write_reference(os.path.join(folder, 'data'), args.genes, args.density,
+															 args.terms, args.seed)
+
+	row_list = list()
+	print('cases\tboost\tstage\twall_sec\tcpu_sec\tpeak_rss_mb')
+	for cases in ladder:
+		cohort_folder = os.path.join(folder, 'cases_' + str(cases))
+		synthetic_cohort.write_cohort(cohort_folder, gene_list, module_list, cases, int(cases * args.control_ratio),
+									  args.genes_per_case, args.seed)
+		for boost in boost_list:
+			stage_record_list = run_nhc(cohort_folder, 'scaling_boost' + boost, boost, args.mode, args.threads,
+										args.nhc_args.split())
+			for stage in stage_list:
+				stage_record_sublist = [record for record in stage_record_list if record['stage'] == stage]
+				if not stage_record_sublist:
+					continue
+				wall = round(sum(record['wall_sec'] for record in stage_record_sublist), 3)
+				cpu = round(sum(record['cpu_sec'] for record in stage_record_sublist), 3)
+				peak_rss = max(record['peak_rss_mb'] for record in stage_record_sublist)
+				row_list.append((cases, boost, stage, wall, cpu, peak_rss))
+				print(str(cases)+'\t'+boost+'\t'+stage+'\t'+str(wall)+'\t'+str(cpu)+'\t'+str(peak_rss))
+
+	exponent_dict = scaling_exponent(row_list)
+	print('\nboost\tstage\tscaling_exponent')
+	for boost, stage in sorted(exponent_dict):
+		print(boost+'\t'+stage+'\t'+str(exponent_dict[(boost, stage)]))
+
+	file_scaling = open(os.path.join(folder, 'scaling.tsv'), 'w')
+	file_scaling.write('cases\tboost\tstage\twall_sec\tcpu_sec\tpeak_rss_mb\n')
+	for row in row_list:
+		file_scaling.write('\t'.join(str(value) for value in row) + '\n')
+	file_scaling.write('\nboost\tstage\tscaling_exponent\n')
+	for boost, stage in sorted(exponent_dict):
+		file_scaling.write(boost+'\t'+stage+'\t'+str(exponent_dict[(boost, stage)])+'\n')
+	file_scaling.close()
+	print('\n>> Scaling table: ' + os.path.join(folder, 'scaling.tsv'))
+
+	if args.baseline is not None:
+		slower_list = regression_list(row_list, args.baseline, args.tolerance)
+		for cases, boost, stage, baseline_wall, wall in slower_list:
+			print('REGRESSION: '+stage+' with '+str(cases)+' cases, boost '+boost+': '+
+				  str(baseline_wall)+' -> '+str(wall)+' sec')
+		if slower_list:
+			sys.exit(1)
+		print('OK: no stage slower than '+str(args.tolerance)+'x its baseline')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Per-job cost of NHC.py against the -serve daemon.
+#
+# Writes a synthetic reference folder and a small cohort (see
+# synthetic_cohort.py), runs the same job -repeat times with NHC.py and with
+# nhc-client against a daemon serving the reference folder, checks that both
+# give the same cluster table and reports the wall time of each run as seen by
+# the caller.
+#
+# Usage: python serve.py [-repeat 5] [-cases 20] [-genes 20000] [-density 40]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import synthetic_cohort
+
+nhc_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+nhc = os.path.join(nhc_folder, 'NHC.py')
+nhc_client = os.path.join(nhc_folder, 'nhc-client')
+
+
+# function for the wall time of one job and its cluster table
+def run_job(command, folder, suffix, environment):
+	start = time.time()
+	result = subprocess.run(command + ['-suffix', suffix], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+							universal_newlines=True, env=environment)
+	end = time.time()
+	if result.returncode != 0:
+		print(result.stdout[-2000:])
+		sys.exit(result.returncode)
+	file_cluster = open(os.path.join(folder, 'NHC_output_' + suffix, 'NHC_output_gene_clusters.txt'), 'r')
+	cluster_table = file_cluster.read()
+	file_cluster.close()
+	shutil.rmtree(os.path.join(folder, 'NHC_output_' + suffix))
+	return end - start, cluster_table
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Per-job cost of NHC.py against the -serve daemon")
+	parser.add_argument("-repeat", type=int, default=5, help="(default=5), number of runs of each kind")
+	parser.add_argument("-cases", type=int, default=20, help="(default=20), number of cases of the job")
+	parser.add_argument("-genes", type=int, default=20000, help="(default=20000), number of genes in the network")
+	parser.add_argument("-density", type=int, default=40, help="(default=40), average number of edges per gene")
+	parser.add_argument("-mode", type=int, default=1, help="(default=1), -mode of the job")
+	args = parser.parse_args()
+
+	folder = tempfile.mkdtemp(prefix='nhc_serve_')
+	data = os.path.join(folder, 'data')
+	gene_list, module_list = synthetic_cohort.write_reference(data, args.genes, args.density, 200, 1)
+	synthetic_cohort.write_cohort(folder, gene_list, module_list, args.cases, args.cases, 20, 1)
+	job_list = ['-path', folder, '-input', 'input.txt', '-pc', os.path.join(folder, 'pc.txt'), '-data', data,
+				'-mode', str(args.mode)]
+	socket_path = os.path.join(folder, 'nhc.sock')
+	environment = dict(os.environ, PYTHONHASHSEED='0')
+	daemon = subprocess.Popen([sys.executable, nhc, '-serve', socket_path, '-data', data], stdout=subprocess.DEVNULL,
+							  env=environment)
+	# the daemon is stopped and the folder removed on every way out
+	try:
+		while not os.path.exists(socket_path):
+			if daemon.poll() is not None:
+				sys.exit('the daemon did not start')
+			time.sleep(0.1)
+
+		print('run\tNHC.py_sec\tnhc-client_sec')
+		local_list = list()
+		served_list = list()
+		for run in range(args.repeat):
+			local_time, local_table = run_job([sys.executable, nhc] + job_list, folder, 'local', environment)
+			served_time, served_table = run_job([sys.executable, nhc_client, '-socket', socket_path] + job_list,
+												folder, 'served', environment)
+			if local_table != served_table:
+				sys.exit('FAIL: the daemon gave another cluster table than NHC.py')
+			local_list.append(local_time)
+			served_list.append(served_time)
+			print(str(run + 1) + '\t' + str(round(local_time, 3)) + '\t' + str(round(served_time, 3)))
+	finally:
+		daemon.terminate()
+		daemon.wait()
+		shutil.rmtree(folder)
+	print('mean\t' + str(round(sum(local_list) / len(local_list), 3)) + '\t' +
+		  str(round(sum(served_list) / len(served_list), 3)))
+
+
+if __name__ == '__main__':
+	main()
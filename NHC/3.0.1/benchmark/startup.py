@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Startup-time benchmark for NHC.py.
+#
+# Runs a tiny -mode 1 job a few times under python -X importtime and reports
+# the wall time, the import time of the heavy dependencies and whether R was
+# started. A -mode 1 run must never import rpy2, the benchmark exits with
+# status 1 when it does.
+#
+# Usage: python startup.py [-repeat 5]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+nhc = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'NHC.py')
+tracked_module_list = ['numpy', 'scipy', 'rpy2']
+
+
+# function for writing a tiny cohort and reference folder
+def write_tiny_input(folder):
+	os.makedirs(os.path.join(folder, 'data'))
+	gene_list = ['GENE' + str(i) for i in range(12)]
+	file_network = open(os.path.join(folder, 'data', 'Data_NHC_Network.txt'), 'w')
+	for i in range(len(gene_list) - 1):
+		file_network.write(gene_list[i] + '\t' + gene_list[i + 1] + '\t0.999\n')
+	file_network.close()
+	file_connectivity = open(os.path.join(folder, 'data', 'Data_NHC_Network_Connectivity.txt'), 'w')
+	for gene in gene_list:
+		file_connectivity.write(gene + '\t2\n')
+	file_connectivity.close()
+	file_geneset = open(os.path.join(folder, 'data', 'Data_NHC_Geneset.txt'), 'w')
+	file_geneset.write('KEGG_Pathway\tTERM1\t.\t' + ','.join(gene_list[0:6]) + '\n')
+	file_geneset.close()
+	file_input = open(os.path.join(folder, 'input.txt'), 'w')
+	file_pc = open(os.path.join(folder, 'pc.txt'), 'w')
+	file_input.write('GROUP\tSAMPLE\tGENE\tVARIANT\n')
+	file_pc.write('ID\tPC1\tPC2\tPC3\n')
+	for i in range(len(gene_list)):
+		sample = 'CASE' + str(i)
+		file_input.write('case\t' + sample + '\t' + gene_list[i] + '\tchr1:' + str(i) + '\n')
+		file_pc.write(sample + '\t0.1\t0.2\t0.3\n')
+	file_input.close()
+	file_pc.close()
+
+
+# function for the import time (us) of each tracked package, summed over the
+# top-level import entries of the package and its submodules
+def import_time(stderr):
+	import_time_dict = dict()
+	for eachline in stderr.split('\n'):
+		if eachline.startswith('import time:') and '|' in eachline:
+			item = eachline[len('import time:'):].split('|')
+			if not item[1].strip().isdigit() or item[2].startswith('  '):
+				continue
+			package = item[2].strip().split('.')[0]
+			if package in tracked_module_list:
+				import_time_dict[package] = import_time_dict.get(package, 0) + int(item[1])
+	return import_time_dict
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Startup-time benchmark for NHC.py in -mode 1")
+	parser.add_argument("-repeat", type=int, default=5, help="(default=5), number of runs")
+	args = parser.parse_args()
+
+	folder = tempfile.mkdtemp(prefix='nhc_startup_')
+	write_tiny_input(folder)
+	command = [sys.executable, '-X', 'importtime', nhc, '-path', folder, '-input', 'input.txt',
+			   '-pc', os.path.join(folder, 'pc.txt'), '-data', os.path.join(folder, 'data'),
+			   '-mode', '1', '-suffix', 'startup']
+	r_started = False
+	print('run\twall_sec\t' + '\t'.join(each_module + '_ms' for each_module in tracked_module_list))
+	for run in range(args.repeat):
+		start = time.time()
+		result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+		end = time.time()
+		if result.returncode != 0:
+			print(result.stderr[-2000:])
+			sys.exit(result.returncode)
+		import_time_dict = import_time(result.stderr)
+		if 'rpy2' in import_time_dict:
+			r_started = True
+		output_list = [str(run + 1), str(round(end - start, 3))]
+		for each_module in tracked_module_list:
+			if each_module in import_time_dict:
+				output_list.append(str(round(import_time_dict[each_module] / 1000, 1)))
+			else:
+				output_list.append('.')
+		print('\t'.join(output_list))
+	shutil.rmtree(folder)
+
+	if r_started:
+		print('FAIL: -mode 1 imported rpy2')
+		sys.exit(1)
+	print('OK: -mode 1 did not import rpy2')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Synthetic cohort generator for benchmarking NHC without patient data.
+#
+# Writes an -input file, a -pc file and a data folder (network, connectivity
+# and gene sets) in the formats NHC.py reads. Genes are grouped in modules
+# that are densely connected by strong edges and that the module terms of the
+# gene sets follow; a share of the cases carry several genes of a few disease
+# modules, so that the clustering, merging and enrichment stages all have
+# real work to do. The same -seed always gives the same files.
+#
+# Usage: python synthetic_cohort.py -out <folder> [-cases 200] [-controls 200]
+#        [-genes 5000] [-genes_per_case 20] [-density 20] [-terms 200] [-seed 1]
+
+import os
+import random
+import argparse
+
+database_list = ['MSigDB_Hallmark','KEGG_Pathway','Reactome_Pathway','Wiki_Pathway',
+				'GO_BiologicalProcess','GO_MolecularFunction']
+module_size = 20
+disease_module_count = 5
+
+
+# function for the reference files of the data folder: genes, a network with
+# density edges per gene, their connectivity and terms gene sets per database
+def write_reference(data, genes, density, terms, seed):
+	rand = random.Random(seed)
+	os.makedirs(data, exist_ok=True)
+	gene_list = ['SG' + str(i).zfill(5) for i in range(genes)]
+	module_list = [gene_list[i:i + module_size] for i in range(0, genes, module_size)]
+
+	# a third of the edges of a gene stay in its module and are strong, the
+	# others go anywhere and are mostly below the default -edge cutoff
+	degree_dict = dict.fromkeys(gene_list, 0)
+	file_network = open(os.path.join(data, 'Data_NHC_Network.txt'), 'w')
+	for gene_id in range(genes):
+		module = module_list[gene_id // module_size]
+		for k in range(max(1, density // 2)):
+			if rand.random() < 1 / 3 and len(module) > 1:
+				partner = rand.choice(module)
+				weight = round(rand.uniform(0.99, 1.0), 3)
+			else:
+				partner = rand.choice(gene_list)
+				weight = round(min(rand.betavariate(8, 2), 0.999), 3)
+			if partner == gene_list[gene_id]:
+				continue
+			file_network.write(gene_list[gene_id] + '\t' + partner + '\t' + str(weight) + '\n')
+			degree_dict[gene_list[gene_id]] += 1
+			degree_dict[partner] += 1
+	file_network.close()
+
+	file_connectivity = open(os.path.join(data, 'Data_NHC_Network_Connectivity.txt'), 'w')
+	for gene in gene_list:
+		file_connectivity.write(gene + '\t' + str(degree_dict[gene]) + '\n')
+	file_connectivity.close()
+
+	# half of the terms follow a module, the other half are random gene sets
+	file_geneset = open(os.path.join(data, 'Data_NHC_Geneset.txt'), 'w')
+	for each_database in database_list:
+		for term_id in range(terms):
+			if term_id % 2 == 0:
+				module = module_list[rand.randrange(len(module_list))]
+				gene_set = rand.sample(module, max(3, int(len(module) * 0.8)) if len(module) >= 3 else len(module))
+				gene_set += rand.sample(gene_list, rand.randint(0, 10))
+			else:
+				gene_set = rand.sample(gene_list, rand.randint(5, 200))
+			file_geneset.write(each_database + '\tSYN_' + each_database.upper() + '_' + str(term_id) + '\t.\t' +
+							   ','.join(sorted(set(gene_set))) + '\n')
+	file_geneset.close()
+	return gene_list, module_list
+
+
+# function for the input and pc files: cases and controls carry
+# genes_per_case random genes with one to three variants each, and half of
+# the cases also carry two to four genes of one of the disease modules
+def write_cohort(folder, gene_list, module_list, cases, controls, genes_per_case, seed):
+	rand = random.Random(seed + 1)
+	os.makedirs(folder, exist_ok=True)
+	disease_module_list = module_list[0:disease_module_count]
+	file_input = open(os.path.join(folder, 'input.txt'), 'w')
+	file_pc = open(os.path.join(folder, 'pc.txt'), 'w')
+	file_input.write('GROUP\tSAMPLE\tGENE\tVARIANT\tINFO\n')
+	file_pc.write('ID\tPC1\tPC2\tPC3\n')
+	for group, sample_count in [('case', cases), ('control', controls)]:
+		for sample_id in range(sample_count):
+			sample = group.upper() + str(sample_id).zfill(6)
+			sample_gene_list = rand.sample(gene_list, min(genes_per_case, len(gene_list)))
+			if group == 'case' and rand.random() < 0.5:
+				module = rand.choice(disease_module_list)
+				sample_gene_list += rand.sample(module, min(rand.randint(2, 4), len(module)))
+			for gene in sorted(set(sample_gene_list)):
+				for k in range(rand.randint(1, 3)):
+					variant = 'chr' + str(rand.randint(1, 22)) + ':' + str(rand.randint(1, 10**8)) + ':A:G'
+					file_input.write(group + '\t' + sample + '\t' + gene + '\t' + variant + '\tsynthetic\n')
+			file_pc.write(sample + '\t' + '\t'.join(str(round(rand.gauss(0, 1), 4)) for k in range(3)) + '\n')
+	file_input.close()
+	file_pc.close()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Synthetic cohort generator for benchmarking NHC")
+	parser.add_argument("-out", required=True, help="folder for input.txt, pc.txt and the data folder")
+	parser.add_argument("-cases", type=int, default=200, help="(default=200), number of cases")
+	parser.add_argument("-controls", type=int, default=200, help="(default=200), number of controls")
+	parser.add_argument("-genes", type=int, default=5000, help="(default=5000), number of genes in the network")
+	parser.add_argument("-genes_per_case", type=int, default=20, help="(default=20), random genes carried by each sample")
+	parser.add_argument("-density", type=int, default=20, help="(default=20), average number of edges per gene")
+	parser.add_argument("-terms", type=int, default=200, help="(default=200), number of terms per gene-set database")
+	parser.add_argument("-seed", type=int, default=1, help="(default=1), random seed")
+	args = parser.parse_args()
+
+	gene_list, module_list = write_reference(os.path.join(args.out, 'data'), args.genes, args.density, args.terms, args.seed)
+	write_cohort(args.out, gene_list, module_list, args.cases, args.controls, args.genes_per_case, args.seed)
+	print('>> Synthetic cohort: ' + os.path.abspath(args.out))
+
+
+if __name__ == '__main__':
+	main()
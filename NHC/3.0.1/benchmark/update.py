@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Check and timing of NHC.py -update on a synthetic cohort.
+#
+# Writes a synthetic cohort (see synthetic_cohort.py) and an earlier version
+# of it that lacks the last -added share of the cases and still has the first
+# -removed share. Runs NHC.py -seeds Y on the earlier cohort, then on the
+# full cohort both with -update from that run and from scratch, and compares
+# the two output folders file by file (NHC_output_seeds.txt included). Exits
+# with status 1 when they differ. All runs use the same PYTHONHASHSEED, as
+# the clusters of NHC depend on the iteration order of its sets.
+#
+# Usage: python update.py [-cases 400] [-controls 50] [-added 0.1] [-removed 0]
+#        [-genes 5000] [-nhc_args '-edge 0.99 -hub 100'] [-seed 1] [-out <folder>]
+
+import os
+import sys
+import time
+import shutil
+import filecmp
+import argparse
+import tempfile
+import subprocess
+import synthetic_cohort
+
+nhc = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'NHC.py')
+# files that differ between the two runs by design
+skip_file_list = ['NHC_input_parameters.txt', 'NHC_profile.json']
+
+
+# function for one NHC run, returns its wall time and the line of stdout
+# with the number of reused seeds
+def run_nhc(folder, filename_input, suffix, extra_list):
+	command = [sys.executable, nhc, '-path', folder, '-input', filename_input, '-pc', os.path.join(folder, 'pc.txt'),
+			   '-data', os.path.join(folder, 'data'), '-seeds', 'Y', '-suffix', suffix] + extra_list
+	environment = dict(os.environ, PYTHONHASHSEED='0')
+	start = time.time()
+	result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+							env=environment)
+	end = time.time()
+	if result.returncode != 0:
+		print(result.stdout[-2000:])
+		sys.exit(result.returncode)
+	reuse_line = '.'
+	for eachline in result.stdout.split('\n'):
+		if 'Seeds reused' in eachline:
+			reuse_line = eachline.strip()
+	return end - start, reuse_line
+
+
+# function for the files that differ between two output folders
+def different_file_list(folder_a, folder_b):
+	different_list = list()
+	comparison_list = [filecmp.dircmp(folder_a, folder_b, ignore=skip_file_list)]
+	while comparison_list:
+		comparison = comparison_list.pop()
+		different_list += comparison.left_only + comparison.right_only + comparison.diff_files + comparison.funny_files
+		comparison_list += comparison.subdirs.values()
+	return different_list
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Check and timing of NHC.py -update on a synthetic cohort")
+	parser.add_argument("-cases", type=int, default=400, help="(default=400), number of cases of the full cohort")
+	parser.add_argument("-controls", type=int, default=50, help="(default=50), number of controls")
+	parser.add_argument("-added", type=float, default=0.1, help="(default=0.1), share of the cases added after the earlier run")
+	parser.add_argument("-removed", type=float, default=0.0, help="(default=0), share of the cases of the earlier run left out of the full cohort")
+	parser.add_argument("-genes", type=int, default=5000, help="(default=5000), number of genes in the network")
+	parser.add_argument("-nhc_args", type=str, default='', help="(default=''), further arguments for NHC.py, e.g. '-edge 0.99 -hub 100'")
+	parser.add_argument("-seed", type=int, default=1, help="(default=1), random seed of the synthetic data")
+	parser.add_argument("-out", type=str, default=None, help="(default=temporary folder, removed at the end), folder for the data and outputs")
+	args = parser.parse_args()
+
+	folder = args.out
+	if folder is None:
+		folder = tempfile.mkdtemp(prefix='nhc_update_')
+	folder = os.path.abspath(folder)
+	gene_list, module_list = synthetic_cohort.write_reference(os.path.join(folder, 'data'), args.genes, 20, 200,
+															 args.seed)
+	synthetic_cohort.write_cohort(folder, gene_list, module_list, args.cases, args.controls, 20, args.seed)
+
+	# the earlier cohort: without the added cases, with the removed ones
+	case_list = ['CASE' + str(case_id).zfill(6) for case_id in range(args.cases)]
+	removed_count = int(args.cases * args.removed)
+	added_count = int(args.cases * args.added)
+	earlier_case_set = set(case_list[0:args.cases - added_count])
+	full_case_set = set(case_list[removed_count:])
+	file_input = open(os.path.join(folder, 'input.txt'), 'r')
+	file_earlier = open(os.path.join(folder, 'input_earlier.txt'), 'w')
+	file_full = open(os.path.join(folder, 'input_full.txt'), 'w')
+	header = file_input.readline()
+	file_earlier.write(header)
+	file_full.write(header)
+	for eachline in file_input:
+		item = eachline.split('\t')
+		if item[0] != 'case' or item[1] in earlier_case_set:
+			file_earlier.write(eachline)
+		if item[0] != 'case' or item[1] in full_case_set:
+			file_full.write(eachline)
+	file_input.close()
+	file_earlier.close()
+	file_full.close()
+
+	extra_list = args.nhc_args.split()
+	earlier_time, reuse_line = run_nhc(folder, 'input_earlier.txt', 'earlier', extra_list)
+	update_time, reuse_line = run_nhc(folder, 'input_full.txt', 'update',
+									  extra_list + ['-update', os.path.join(folder, 'NHC_output_earlier')])
+	full_time = run_nhc(folder, 'input_full.txt', 'full', extra_list)[0]
+	print('cases: '+str(len(earlier_case_set))+' earlier, '+str(len(full_case_set))+' now ('+str(added_count)+
+		  ' added, '+str(removed_count)+' removed)')
+	print(reuse_line)
+	print('earlier run: '+str(round(earlier_time, 3))+' sec')
+	print('update run:  '+str(round(update_time, 3))+' sec')
+	print('full run:    '+str(round(full_time, 3))+' sec')
+
+	different_list = different_file_list(os.path.join(folder, 'NHC_output_update'),
+										 os.path.join(folder, 'NHC_output_full'))
+	if args.out is None:
+		shutil.rmtree(folder)
+	if different_list:
+		print('FAIL: the update differs from the full run in '+', '.join(sorted(different_list)))
+		sys.exit(1)
+	print('OK: the update gives the same output as the full run')
+
+
+if __name__ == '__main__':
+	main()
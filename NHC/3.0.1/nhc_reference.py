@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# python3.8
+__license__ = "CC BY-NC-ND 4.0"
+
+# Compiled network reference for NHC.
+#
+# Data_NHC_Network.txt and Data_NHC_Network_Connectivity.txt are compiled once
+# into a folder of .npy arrays next to them (Data_NHC_Network.bundle), which
+# NHC.py memory-maps instead of parsing the text files on every run:
+#
+#   genes.txt               gene table, the line number is the gene ID
+#   edge_gene.npy           gene IDs (geneA, geneB) of each line of the file
+#   edge_weight.npy         edge weight of each line of the file
+#   adjacency_indptr.npy    CSR row pointers, one row per gene
+#   adjacency_edge.npy      edges of each gene, by decreasing weight
+#   adjacency_weight.npy    weights in the same order as adjacency_edge.npy
+#   connectivity.npy        highest connectivity listed for each gene
+#   manifest.txt            format version, size and mtime of the text files
+#
+# Without a bundle, parse_reference builds the same arrays in memory from the
+# text files, for callers that filter the network several times, and
+# text_reference stands for the text files themselves, which case_network then
+# filters line by line, cheaper for a single filter.
+#
+# Usage: nhc-compile-reference -data <folder with the NHC reference files>
+
+import os
+import array
+import argparse
+import numpy as np
+
+bundle_name = 'Data_NHC_Network.bundle'
+bundle_version = '1'
+source_list = ['Data_NHC_Network.txt', 'Data_NHC_Network_Connectivity.txt']
+no_connectivity = np.iinfo(np.int64).min
+array_list = ['edge_gene', 'edge_weight', 'adjacency_indptr', 'adjacency_edge',
+			  'adjacency_weight', 'connectivity']
+
+
+# function for the size and mtime of the text reference files
+def source_fingerprint(data):
+	fingerprint_list = list()
+	for each_source in source_list:
+		source_stat = os.stat(os.path.join(data, each_source))
+		fingerprint_list.append(each_source + '\t' + str(source_stat.st_size) + '\t' + str(source_stat.st_mtime_ns))
+	return fingerprint_list
+
+
+# function for the fingerprint of the network reference of a data folder, from
+# the text files or, when only the bundle was shipped, from its manifest
+def reference_fingerprint(data):
+	if all(os.path.exists(os.path.join(data, each_source)) for each_source in source_list):
+		return source_fingerprint(data)
+	file_manifest = open(os.path.join(data, bundle_name, 'manifest.txt'), 'r')
+	manifest = file_manifest.read().strip().split('\n')
+	file_manifest.close()
+	return manifest[1:]
+
+
+# function for parsing the text reference files into the arrays of a bundle,
+# held in memory; used when no bundle was compiled and by compile_reference
+def parse_reference(data):
+	gene_id_dict = dict()
+	gene_list = list()
+	edge_gene_list = array.array('i')
+	edge_weight_list = array.array('d')
+	file_network = open(os.path.join(data, 'Data_NHC_Network.txt'), 'r')
+	for eachline in file_network:
+		item = eachline.strip().split('\t')
+		for gene in item[0:2]:
+			if gene not in gene_id_dict:
+				gene_id_dict[gene] = len(gene_list)
+				gene_list.append(gene)
+		edge_gene_list.append(gene_id_dict[item[0]])
+		edge_gene_list.append(gene_id_dict[item[1]])
+		edge_weight_list.append(float(item[2]))
+	file_network.close()
+
+	edge_gene = np.frombuffer(edge_gene_list, dtype=np.int32).reshape(-1, 2)
+	edge_weight = np.frombuffer(edge_weight_list, dtype=np.float64)
+	edge_index = np.arange(len(edge_weight), dtype=np.int64)
+	adjacency_gene = np.concatenate((edge_gene[:, 0], edge_gene[:, 1]))
+	adjacency_edge = np.concatenate((edge_index, edge_index))
+	adjacency_weight = np.concatenate((edge_weight, edge_weight))
+	order = np.lexsort((adjacency_edge, -adjacency_weight, adjacency_gene))
+	adjacency_indptr = np.zeros(len(gene_list) + 1, dtype=np.int64)
+	adjacency_indptr[1:] = np.cumsum(np.bincount(adjacency_gene, minlength=len(gene_list)))
+
+	connectivity = np.full(len(gene_list), no_connectivity, dtype=np.int64)
+	file_connectivity = open(os.path.join(data, 'Data_NHC_Network_Connectivity.txt'), 'r')
+	for eachline in file_connectivity:
+		item = eachline.strip().split('\t')
+		gene = item[0]
+		if gene in gene_id_dict:
+			connectivity[gene_id_dict[gene]] = max(connectivity[gene_id_dict[gene]], int(item[1]))
+	file_connectivity.close()
+
+	reference = dict()
+	reference['gene_list'] = gene_list
+	reference['gene_id_dict'] = gene_id_dict
+	reference['edge_gene'] = edge_gene
+	reference['edge_weight'] = edge_weight
+	reference['adjacency_indptr'] = adjacency_indptr
+	reference['adjacency_edge'] = adjacency_edge[order]
+	reference['adjacency_weight'] = adjacency_weight[order]
+	reference['connectivity'] = connectivity
+	return reference
+
+
+# function for a network reference that is never parsed: case_network filters
+# the text files of the data folder line by line for it
+def text_reference(data):
+	reference = dict()
+	reference['data'] = data
+	return reference
+
+
+# function for the network among the case genes from the text files, line by
+# line: only the edges between case genes are kept, nothing else is held
+def text_case_network(data, case_gene_set, edge_cutoff, hub_cutoff):
+	file_connectivity = open(os.path.join(data, 'Data_NHC_Network_Connectivity.txt'), 'r')
+	hub_gene_set = set()
+	for eachline in file_connectivity:
+		item = eachline.strip().split('\t')
+		gene = item[0]
+		connectivity = int(item[1])
+		if connectivity >= hub_cutoff:
+			hub_gene_set.add(gene)
+	file_connectivity.close()
+
+	file_network = open(os.path.join(data, 'Data_NHC_Network.txt'), 'r')
+	case_network_dict = dict()
+	for eachline in file_network:
+		item = eachline.strip().split('\t')
+		geneA = item[0]
+		geneB = item[1]
+		gene_pair = (geneA, geneB)
+		edge = float(item[2])
+		if (geneA in case_gene_set) and (geneB in case_gene_set) and (edge >= edge_cutoff):
+			if hub_cutoff == 0:
+				case_network_dict[gene_pair] = edge
+			else:
+				if (geneA not in hub_gene_set) and (geneB not in hub_gene_set):
+					case_network_dict[gene_pair] = edge
+	file_network.close()
+	return case_network_dict
+
+
+# function for compiling the text reference files into a bundle
+def compile_reference(data):
+	bundle = os.path.join(data, bundle_name)
+	os.makedirs(bundle, exist_ok=True)
+	reference = parse_reference(data)
+
+	file_gene = open(os.path.join(bundle, 'genes.txt'), 'w')
+	for gene in reference['gene_list']:
+		file_gene.write(gene + '\n')
+	file_gene.close()
+	for each_array in array_list:
+		np.save(os.path.join(bundle, each_array + '.npy'), reference[each_array])
+	# the manifest goes last, a bundle without one is never loaded
+	file_manifest = open(os.path.join(bundle, 'manifest.txt'), 'w')
+	file_manifest.write('version\t' + bundle_version + '\n')
+	for each_fingerprint in source_fingerprint(data):
+		file_manifest.write(each_fingerprint + '\n')
+	file_manifest.close()
+	return len(reference['gene_list']), len(reference['edge_weight'])
+
+
+# function for loading the bundle of a data folder, memory-mapped; returns
+# None when there is no bundle or the text files changed after compiling
+def load_reference(data):
+	bundle = os.path.join(data, bundle_name)
+	if not os.path.exists(os.path.join(bundle, 'manifest.txt')):
+		return None
+	file_manifest = open(os.path.join(bundle, 'manifest.txt'), 'r')
+	manifest = file_manifest.read().strip().split('\n')
+	file_manifest.close()
+	if manifest[0] != 'version\t' + bundle_version:
+		print('   Ignoring ' + bundle + ', compiled by another version\n')
+		return None
+	if all(os.path.exists(os.path.join(data, each_source)) for each_source in source_list):
+		if manifest[1:] != source_fingerprint(data):
+			print('   Ignoring ' + bundle + ', the network files changed after compiling\n')
+			return None
+
+	reference = dict()
+	file_gene = open(os.path.join(bundle, 'genes.txt'), 'r')
+	reference['gene_list'] = file_gene.read().split('\n')[:-1]
+	file_gene.close()
+	reference['gene_id_dict'] = dict()
+	for gene_id in range(len(reference['gene_list'])):
+		reference['gene_id_dict'][reference['gene_list'][gene_id]] = gene_id
+	for each_array in array_list:
+		reference[each_array] = np.load(os.path.join(bundle, each_array + '.npy'), mmap_mode='r')
+	return reference
+
+
+# function for the network among the case genes, same as filtering the text
+# file line by line: edges of at least edge_cutoff between two case genes,
+# without hub genes unless hub_cutoff is 0, added in the order of the network
+# file so that repeated pairs end up as they would from the text file; the
+# edges of a gene are sorted by weight, so the cutoff is a slice of its row.
+# A text_reference is filtered line by line instead
+def case_network(reference, case_gene_set, edge_cutoff, hub_cutoff):
+	if 'gene_list' not in reference:
+		return text_case_network(reference['data'], case_gene_set, edge_cutoff, hub_cutoff)
+	gene_id_dict = reference['gene_id_dict']
+	case_gene_flag = np.zeros(len(reference['gene_list']), dtype=bool)
+	edge_slice_list = list()
+	for gene in case_gene_set:
+		if gene in gene_id_dict:
+			gene_id = gene_id_dict[gene]
+			case_gene_flag[gene_id] = True
+			row_start = reference['adjacency_indptr'][gene_id]
+			row_end = reference['adjacency_indptr'][gene_id + 1]
+			row_weight = reference['adjacency_weight'][row_start:row_end]
+			row_count = np.searchsorted(-row_weight, -edge_cutoff, side='right')
+			edge_slice_list.append(reference['adjacency_edge'][row_start:row_start + row_count])
+	case_network_dict = dict()
+	if not edge_slice_list:
+		return case_network_dict
+
+	edge_index = np.unique(np.concatenate(edge_slice_list))
+	edge_gene = reference['edge_gene'][edge_index]
+	keep = case_gene_flag[edge_gene[:, 0]] & case_gene_flag[edge_gene[:, 1]]
+	if hub_cutoff != 0:
+		keep &= reference['connectivity'][edge_gene[:, 0]] < hub_cutoff
+		keep &= reference['connectivity'][edge_gene[:, 1]] < hub_cutoff
+	edge_index = edge_index[keep]
+	edge_gene = edge_gene[keep]
+	edge_weight = reference['edge_weight'][edge_index]
+	gene_list = reference['gene_list']
+	for k in range(len(edge_index)):
+		case_network_dict[(gene_list[edge_gene[k, 0]], gene_list[edge_gene[k, 1]])] = float(edge_weight[k])
+	return case_network_dict
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compile the NHC network reference into a memory-mappable bundle")
+	parser.add_argument("-data", required=True, help="Absolute path to data folder contain reference files for NHC.")
+	args = parser.parse_args()
+	data = os.path.abspath(args.data)
+	print('>> Compiling ' + os.path.join(data, bundle_name))
+	gene_count, edge_count = compile_reference(data)
+	print('   # Genes: ' + str(gene_count))
+	print('   # Edges: ' + str(edge_count) + '\n')
+
+
+if __name__ == '__main__':
+	main()